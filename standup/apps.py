@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class StandupConfig(AppConfig):
+    name = 'standup'
+
+    def ready(self):
+        from standup import signals
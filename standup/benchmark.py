@@ -0,0 +1,234 @@
+import asyncio
+import datetime
+import itertools
+import time
+import tracemalloc
+
+from django.db import connection
+from django.utils import timezone
+
+from standup import metrics
+from standup import models
+from standup.dispatcher import MessageDispatcher
+from standup.executor import DatabaseExecutor
+from standup.lease import Lease
+from standup.scheduler import StandupScheduler
+
+
+class FakeMessage(object):
+
+    def __init__(self, client, channel, content):
+        self.id = next(client.ids)
+        self.channel = channel
+        self.content = content
+        self.client = client
+
+
+class FakeTarget(object):
+    '''
+    A Discord user or channel that only records what is sent to it.
+    '''
+
+    def __init__(self, client, id):
+        self.client = client
+        self.id = id
+
+    async def send(self, content=None, **kwargs):
+        await self.client.call('send')
+        return FakeMessage(self.client, self, content)
+
+
+class FakeHTTP(object):
+
+    def __init__(self, client):
+        self.client = client
+
+    async def edit_message(self, channel_id, message_id, **fields):
+        await self.client.call('edit')
+
+    async def delete_message(self, channel_id, message_id):
+        await self.client.call('delete')
+
+    async def pin_message(self, channel_id, message_id):
+        await self.client.call('pin')
+
+
+class FakeDiscordClient(object):
+    '''
+    Stands in for the bot's `discord.Client` in benchmarks, every API call
+    takes `latency` seconds and is counted by kind.
+    '''
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.ids = itertools.count(10 ** 17)
+        self.calls = {}
+        self.http = FakeHTTP(self)
+
+    async def call(self, kind):
+        self.calls[kind] = self.calls.get(kind, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def get_user(self, id):
+        return FakeTarget(self, id)
+
+    def get_channel(self, id):
+        return FakeTarget(self, id)
+
+
+class Benchmark(object):
+    '''
+    Times the bot's hot paths on the data in the database, reporting the wall
+    time, the number of queries and the peak memory allocated by Python of
+    every step. Database work runs inline, so everything can be rolled back.
+    '''
+
+    def __init__(self, latency=0.0, workers=8, prefix=None):
+        self.latency = latency
+        self.workers = workers
+        # The prefix of a synthetic dataset, limits the scenarios to its rows
+        self.prefix = prefix
+        self.queries = metrics.QueryCounter()
+        self.results = {}
+
+    def measure(self, name, func, *args):
+        tracemalloc.start()
+        queries = self.queries.count
+        start = time.perf_counter()
+
+        with connection.execute_wrapper(self.queries):
+            extra = func(*args) or {}
+
+        result = {
+            'wall_seconds': round(time.perf_counter() - start, 6),
+            'queries': self.queries.count - queries,
+            'peak_memory_bytes': tracemalloc.get_traced_memory()[1],
+        }
+        tracemalloc.stop()
+
+        result.update(extra)
+        self.results[name] = result
+        return result
+
+    def run(self):
+        # Imported here, the command module needs discord.py to be importable
+        from standup.management.commands.run_bot import initiate_attendees
+
+        scheduler = StandupScheduler()
+        self.measure('scheduler_rebuild', self.scheduler_rebuild, scheduler)
+
+        lease = Lease('benchmark', duration=3600)
+        lease.heartbeat()
+        try:
+            self.measure('tick', self.tick, initiate_attendees, lease)
+        finally:
+            # Or a kept run would block the next one for an hour
+            lease.release()
+
+        self.measure('summary_render', self.summary_render)
+        self.measure('summary_publish', self.summary_publish)
+        return self.results
+
+    def scheduler_rebuild(self, scheduler):
+        scheduler.rebuild()
+        return {'attendees': len(scheduler._entries)}
+
+    def _dispatch(self, coroutine_func):
+        '''
+        Runs a coroutine using a dispatcher and a fake client, until every
+        queued Discord call is done.
+        '''
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        client = FakeDiscordClient(latency=self.latency)
+
+        async def main():
+            dispatcher = MessageDispatcher(workers=self.workers, rate=10 ** 6)
+            workers = asyncio.ensure_future(dispatcher.run())
+            result = await coroutine_func(client, dispatcher)
+            while dispatcher.queue_depth:
+                await asyncio.sleep(0.001)
+            workers.cancel()
+            try:
+                await workers
+            except asyncio.CancelledError:
+                pass
+            return result
+
+        try:
+            result = loop.run_until_complete(main())
+        finally:
+            loop.close()
+            asyncio.set_event_loop(None)
+
+        result['discord_calls'] = client.calls
+        return result
+
+    def tick(self, initiate_attendees, lease):
+        '''
+        A morning rush, every active attendee is due in the same tick.
+        '''
+        async def run(client, dispatcher):
+            attendees = models.Attendee.objects.filter(active=True)
+            if self.prefix:
+                attendees = attendees.filter(user__username__startswith=self.prefix)
+            ids = list(attendees.values_list('id', flat=True))
+            event_ids = set(attendees.values_list('standup_id', flat=True))
+            notifications = initiate_attendees(event_ids, lease)
+
+            for discord_id, messages in notifications:
+                user = client.get_user(discord_id)
+                for msg in messages:
+                    dispatcher.send(user, msg)
+
+            return {'attendees': len(ids), 'notified': len(notifications)}
+
+        return self._dispatch(run)
+
+    def _latest_standups(self):
+        '''
+        The standups of the most recent day that's past the publish delay.
+        '''
+        standups = models.Standup.objects.all()
+        if self.prefix:
+            standups = standups.filter(event__channel__server__slug__startswith=self.prefix)
+
+        before = timezone.now().date() - datetime.timedelta(days=2)
+        last = standups.filter(standup_date__lte=before).order_by('-standup_date').values_list('standup_date', flat=True).first()
+        return standups.filter(standup_date=last).select_related('event__channel__server', 'event__standup_type')
+
+    def summary_render(self):
+        standups = list(self._latest_standups())
+        messages = 0
+        for standup in standups:
+            summary = standup.build_summary()
+            if summary:
+                messages += len(summary[1])
+
+        return {'standups': len(standups), 'messages': messages}
+
+    def summary_publish(self):
+        '''
+        Publishes the latest standups as if for the first time, through the
+        summary markers like the bot does.
+        '''
+        standups = self._latest_standups()
+        ids = set(standups.values_list('id', flat=True))
+        models.StandupSummaryMessage.objects.filter(standup__in=standups).delete()
+        standups.update(pinned_message_id=None)
+        models.StandupSummaryRebuild.objects.bulk_create([models.StandupSummaryRebuild(standup=s) for s in standups])
+        models.StandupType.objects.filter(standups__standups__in=standups).update(publish_to_channel=True)
+
+        async def run(client, dispatcher):
+            db = DatabaseExecutor(max_workers=0)
+            published = 0
+            for standup in models.StandupSummaryRebuild.objects.pending_standups():
+                # Markers of other standups are left for the bot
+                if standup.id not in ids:
+                    continue
+                if await standup.send_summary(client, db, dispatcher):
+                    published += 1
+            return {'published': published}
+
+        return self._dispatch(run)
@@ -0,0 +1,43 @@
+import hashlib
+
+from django.core.cache import caches
+from django.db import transaction
+
+from standup import models
+
+
+def page_cache():
+    return caches['standup_pages']
+
+
+def public_page_key(server, channel, standup_type, date):
+    '''
+    Cache key of a rendered public standup page, hashed so any slug is safe
+    to use with every cache backend.
+    '''
+    raw = '%s/%s/%s/%s' % (server, channel, standup_type, date)
+    return 'standup-page:%s' % hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+
+def invalidate_standup_page(**lookup):
+    '''
+    Drops the cached pages of the standups matching the lookup once the
+    current transaction commits, so a request can't put the old version back
+    before the change is visible.
+    '''
+    def invalidate():
+        pages = models.Standup.objects.filter(**lookup).values_list(
+            'event__channel__server__slug', 
+            'event__channel__slug', 
+            'event__standup_type__command_name', 
+            'standup_date').distinct()
+
+        keys = [public_page_key(server, channel, standup_type, str(date)) for server, channel, standup_type, date in pages]
+        if keys:
+            page_cache().delete_many(keys)
+
+    transaction.on_commit(invalidate)
+
+
+def invalidate_all_pages():
+    transaction.on_commit(lambda: page_cache().clear())
@@ -0,0 +1,153 @@
+import asyncio
+import json
+import socket
+import uuid
+
+from django.conf import settings
+from django.db import connection, transaction
+
+
+CHANNEL = 'standup_changes'
+
+# Every process ignores its own notifications, it already knows about them
+ORIGIN = uuid.uuid4().hex
+
+
+def publish(kind, pk):
+    '''
+    Tells the bot(s) that something changed once the current transaction
+    commits. `kind` is 'summary' for a standup whose summary is out of date,
+    or one of the scheduler kinds (users, types, events, attendees).
+    On PostgreSQL this is a NOTIFY, which is only delivered on commit, other
+    databases send a datagram to the bot on localhost.
+    '''
+    payload = json.dumps([ORIGIN, kind, pk])
+
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, payload])
+    elif settings.CHANGEFEED_PORT:
+        transaction.on_commit(lambda: _send_datagram(payload))
+
+
+def _send_datagram(payload):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        # Every shard, they each decide if the change is theirs
+        for shard_id in range(settings.BOT_SHARD_COUNT):
+            try:
+                sock.sendto(payload.encode('utf-8'), (settings.CHANGEFEED_HOST, settings.CHANGEFEED_PORT + shard_id))
+            except OSError:
+                # Nobody listening is fine, the bot resyncs periodically anyway
+                pass
+    finally:
+        sock.close()
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self, listener):
+        self.listener = listener
+
+    def datagram_received(self, data, addr):
+        self.listener.dispatch(data.decode('utf-8', 'replace'))
+
+
+class ChangeFeedListener(object):
+    '''
+    Receives the notifications sent by `publish()` in the bot's event loop
+    and calls `callback(kind, pk)` for each of them. Uses a dedicated LISTEN
+    connection on PostgreSQL and a localhost datagram socket otherwise.
+    `listening` is False while the feed isn't available, the bot falls back
+    to polling then. `reliable` is only True for PostgreSQL, the datagrams
+    can get lost without anyone noticing.
+    '''
+
+    def __init__(self, callback, shard_id=0, reconnect_interval=5):
+        self.callback = callback
+        self.shard_id = shard_id
+        self.reconnect_interval = reconnect_interval
+        self.listening = False
+        self.reliable = False
+        self.received = 0
+        self._loop = None
+        self._conn = None
+        self._transport = None
+
+    async def start(self, loop=None):
+        self._loop = loop or asyncio.get_event_loop()
+
+        try:
+            if connection.vendor == 'postgresql':
+                self._listen_postgresql()
+            elif settings.CHANGEFEED_PORT:
+                self._transport, _ = await self._loop.create_datagram_endpoint(
+                    lambda: _DatagramProtocol(self),
+                    local_addr=(settings.CHANGEFEED_HOST, settings.CHANGEFEED_PORT + self.shard_id))
+                self.listening = True
+        except Exception as e:
+            print('Change feed not available, polling instead: %s' % e)
+            if connection.vendor == 'postgresql':
+                self._retry()
+
+        return self.listening
+
+    def _listen_postgresql(self):
+        import psycopg2
+        import psycopg2.extensions
+
+        # Not one of Django's connections, this one stays open and idle
+        self._conn = psycopg2.connect(**connection.get_connection_params())
+        self._conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with self._conn.cursor() as cursor:
+            cursor.execute('LISTEN %s' % CHANNEL)
+
+        self._loop.add_reader(self._conn, self._poll_postgresql)
+        self.listening = True
+        self.reliable = True
+
+        # Summaries marked while the connection was down were never notified
+        self.callback('summary', None)
+
+    def _poll_postgresql(self):
+        try:
+            self._conn.poll()
+        except Exception as e:
+            print('Change feed connection lost: %s' % e)
+            self.stop()
+            self._retry()
+            return
+
+        while self._conn.notifies:
+            self.dispatch(self._conn.notifies.pop(0).payload)
+
+    def _retry(self):
+        def restart():
+            asyncio.ensure_future(self.start(self._loop))
+
+        self._loop.call_later(self.reconnect_interval, restart)
+
+    def dispatch(self, payload):
+        try:
+            origin, kind, pk = json.loads(payload)
+        except ValueError:
+            return
+
+        if origin == ORIGIN:
+            return
+
+        self.received += 1
+        self.callback(kind, pk)
+
+    def stop(self):
+        self.listening = False
+        self.reliable = False
+
+        if self._conn is not None:
+            self._loop.remove_reader(self._conn)
+            self._conn.close()
+            self._conn = None
+
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
@@ -0,0 +1,211 @@
+import asyncio
+import collections
+import random
+
+import aiohttp
+import discord
+
+from standup import metrics
+
+
+# Statuses discord.py's HTTP client already retries itself, together with the
+# rate limits of its buckets (429)
+RETRIED_BY_DISCORD = (429, 500, 502)
+
+
+class MissingTarget(Exception):
+    pass
+
+
+class MessageDispatcher(object):
+    '''
+    Sends the bot's outbound Discord messages with a bounded pool of workers.
+
+    Every call belongs to a route (a DM or a channel), calls on the same route
+    are done one by one in the order they were submitted, so a summary or a
+    couple of DMs to the same user never arrive out of order. Different routes
+    are handled concurrently, limited by the number of workers and a global
+    requests-per-second budget. Routes only keep that order, the rate limits
+    of Discord's buckets are left to discord.py, which also retries 429, 500
+    and 502 responses up to 5 times. The dispatcher only retries what
+    discord.py doesn't, other server errors and connection failures, with
+    exponential backoff.
+    '''
+
+    def __init__(self, workers=8, rate=45, retries=3, backoff=1.0, max_backoff=60.0):
+        self.workers = workers
+        self.rate = rate
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.pending = 0
+        self.in_flight = 0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+
+        # Routes with pending calls wait in the ready queue, a route is only
+        # in there once so two workers never work on the same route.
+        self._ready = asyncio.Queue()
+        self._routes = {}
+        self._tokens = float(rate)
+        self._updated = None
+
+    @property
+    def queue_depth(self):
+        '''
+        Number of calls that are waiting or being sent right now.
+        '''
+        return self.pending + self.in_flight
+
+    def stats(self):
+        return {
+            'queue_depth': self.queue_depth,
+            'sent': self.sent,
+            'retried': self.retried,
+            'failed': self.failed,
+        }
+
+    def report(self):
+        print('Dispatcher: %(queue_depth)d queued, %(sent)d sent, %(retried)d retried, %(failed)d failed' % self.stats())
+
+    def route_for(self, target):
+        if isinstance(target, discord.abc.User):
+            return ('user', target.id)
+        return ('channel', target.id)
+
+    def submit(self, route, func, *args, **kwargs):
+        '''
+        Queues `func(*args, **kwargs)` (a coroutine function doing one API call)
+        on the given route, returns a future with its result.
+        '''
+        future = asyncio.get_event_loop().create_future()
+
+        if route not in self._routes:
+            self._routes[route] = collections.deque()
+            self._ready.put_nowait(route)
+
+        self._routes[route].append((func, args, kwargs, future, asyncio.get_event_loop().time()))
+        self.pending += 1
+        return future
+
+    def send(self, target, content=None, **kwargs):
+        '''
+        Queues a message to a user, member or channel. The returned future
+        fails with `MissingTarget` if the target is None, like a channel the
+        bot can't see.
+        '''
+        if target is None:
+            future = asyncio.get_event_loop().create_future()
+            future.set_exception(MissingTarget('Nothing to send to, the user or channel is not known to the bot'))
+            return future
+
+        return self.submit(self.route_for(target), target.send, content, **kwargs)
+
+    def pin(self, http, channel_id, message_id):
+        '''
+        Queues pinning a message by ID.
+        '''
+        return self.submit(('channel', channel_id), http.pin_message, channel_id, message_id)
+
+    def edit(self, http, channel_id, message_id, content):
+        '''
+        Queues an edit of a message by ID, without fetching the message first.
+        '''
+        return self.submit(('channel', channel_id), http.edit_message, channel_id, message_id, content=content)
+
+    def delete(self, http, channel_id, message_id):
+        return self.submit(('channel', channel_id), http.delete_message, channel_id, message_id)
+
+    async def run(self):
+        await asyncio.gather(*[self._worker() for _ in range(self.workers)])
+
+    async def _worker(self):
+        while True:
+            route = await self._ready.get()
+            func, args, kwargs, future, submitted = self._routes[route].popleft()
+            self.pending -= 1
+            self.in_flight += 1
+
+            try:
+                result = await self._call(route, func, args, kwargs)
+                if not future.cancelled():
+                    future.set_result(result)
+            except asyncio.CancelledError:
+                # Shutting down, on Python 3.7 this is an Exception as well
+                future.cancel()
+                raise
+            except Exception as e:
+                self.failed += 1
+                metrics.dispatch_errors.inc(route=route[0])
+                if not future.cancelled():
+                    future.set_exception(e)
+            finally:
+                self.in_flight -= 1
+                metrics.dispatch_latency.observe(asyncio.get_event_loop().time() - submitted, route=route[0])
+
+                # Back of the line if there's more for this route, so busy
+                # routes don't starve the others
+                if self._routes[route]:
+                    self._ready.put_nowait(route)
+                else:
+                    del self._routes[route]
+
+    async def _call(self, route, func, args, kwargs):
+        attempt = 0
+
+        while True:
+            await self._acquire()
+
+            try:
+                result = await func(*args, **kwargs)
+                self.sent += 1
+                return result
+            except discord.HTTPException as e:
+                if attempt >= self.retries or e.status in RETRIED_BY_DISCORD or e.status < 500:
+                    raise
+                delay = self._retry_after(e, attempt)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt >= self.retries:
+                    raise
+                delay = self._retry_after(None, attempt)
+
+            attempt += 1
+            self.retried += 1
+            metrics.dispatch_retries.inc(route=route[0])
+            await asyncio.sleep(delay)
+
+    def _retry_after(self, error, attempt):
+        delay = min(self.backoff * (2 ** attempt), self.max_backoff)
+        delay += random.uniform(0, delay / 2)
+
+        headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+
+        if headers.get('Retry-After'):
+            try:
+                delay = max(delay, min(float(headers['Retry-After']), self.max_backoff))
+            except ValueError:
+                pass
+
+        return delay
+
+    async def _acquire(self):
+        '''
+        Waits for a slot in the global budget, a token bucket refilling at
+        `rate` calls per second.
+        '''
+        loop = asyncio.get_event_loop()
+
+        while True:
+            now = loop.time()
+
+            if self._updated is not None:
+                self._tokens = min(float(self.rate), self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+
+            await asyncio.sleep((1 - self._tokens) / self.rate)
@@ -0,0 +1,87 @@
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections
+
+
+class DatabaseExecutor(object):
+    '''
+    Runs blocking Django ORM work on a bounded thread pool so the bot's event
+    loop (and with it the Discord gateway heartbeat) never waits on the
+    database. Every worker thread has its own database connection, stale
+    connections are closed before and after every job just like Django does
+    around a request. A pool size of 0 runs the work inline on the event loop,
+    which is only useful to compare the loop latency against.
+    '''
+
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self._pool = None
+
+        if max_workers > 0:
+            self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='standup-db')
+
+    def _call(self, func, args, kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    async def run(self, func, *args, **kwargs):
+        '''
+        Runs `func(*args, **kwargs)` on the pool and returns its result.
+        '''
+        if not self._pool:
+            return func(*args, **kwargs)
+
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._pool, functools.partial(self._call, func, args, kwargs))
+
+    def shutdown(self):
+        if self._pool:
+            self._pool.shutdown(wait=True)
+
+
+class LoopMonitor(object):
+    '''
+    Measures how long the event loop is blocked by scheduling a short sleep
+    and recording how late it wakes up. Every `report_interval` seconds the
+    average and worst lag are printed, so the blocking can be compared between
+    pool sizes (use a pool size of 0 for the old inline behaviour).
+    '''
+
+    def __init__(self, interval=0.1, report_interval=60):
+        self.interval = interval
+        self.report_interval = report_interval
+        self.reset()
+
+    def reset(self):
+        self.samples = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+
+    def record(self, lag):
+        self.samples += 1
+        self.total_lag += lag
+        self.max_lag = max(self.max_lag, lag)
+
+    def report(self):
+        avg = self.total_lag / self.samples if self.samples else 0.0
+        print('Event loop lag over %d samples: avg %.1f ms, max %.1f ms' % (self.samples, avg * 1000, self.max_lag * 1000))
+
+    async def run(self):
+        last_report = time.monotonic()
+
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.record(max(now - start - self.interval, 0.0))
+
+            if now - last_report >= self.report_interval:
+                self.report()
+                self.reset()
+                last_report = now
@@ -0,0 +1,490 @@
+import asyncio
+import collections
+import datetime
+import itertools
+import json
+import random
+import time
+import uuid
+
+import aiohttp
+from aiohttp import web
+
+from standup import models
+from standup.sharding import Shard
+
+
+API_PREFIX = '/api/v7'
+DISCORD_EPOCH = 1420070400000
+
+# Gateway opcodes
+DISPATCH = 0
+HEARTBEAT = 1
+IDENTIFY = 2
+RESUME = 6
+REQUEST_MEMBERS = 8
+INVALID_SESSION = 9
+HELLO = 10
+HEARTBEAT_ACK = 11
+
+HEARTBEAT_INTERVAL = 41250
+
+# Discord only sends the members of large guilds when asked, in chunks
+LARGE_THRESHOLD = 250
+CHUNK_SIZE = 1000
+
+
+def _now():
+    return datetime.datetime.utcnow().isoformat() + '+00:00'
+
+
+def _json(data, status=200):
+    # discord.py only decodes bodies whose content type is exactly this, no charset
+    return web.Response(body=json.dumps(data).encode('utf-8'), status=status, headers={'Content-Type': 'application/json'})
+
+
+def _error(status, code, message):
+    return _json({'code': code, 'message': message}, status=status)
+
+
+class GatewaySession(object):
+    '''
+    One gateway connection of a bot, receives the events of the guilds of
+    the shard it identified with.
+    '''
+
+    def __init__(self, fake, ws):
+        self.fake = fake
+        self.ws = ws
+        self.shard = None
+        self.session_id = uuid.uuid4().hex
+        self.sequence = 0
+
+    def owns_guild(self, guild_id):
+        return self.shard is not None and self.shard.owns_guild(guild_id)
+
+    async def send(self, op, data, event=None):
+        payload = {'op': op, 'd': data}
+        if op == DISPATCH:
+            self.sequence += 1
+            payload.update(t=event, s=self.sequence)
+        await self.ws.send_str(json.dumps(payload))
+
+    async def dispatch(self, event, data):
+        await self.send(DISPATCH, data, event)
+
+    async def received(self, payload):
+        op, data = payload.get('op'), payload.get('d')
+
+        if op == HEARTBEAT:
+            await self.send(HEARTBEAT_ACK, None)
+        elif op == IDENTIFY:
+            await self.identify(data)
+        elif op == RESUME:
+            # Sessions don't survive a reconnect, the bot identifies again
+            await self.send(INVALID_SESSION, False)
+        elif op == REQUEST_MEMBERS:
+            guild_ids = data['guild_id'] if isinstance(data['guild_id'], list) else [data['guild_id']]
+            for guild_id in guild_ids:
+                await self.send_members(str(guild_id))
+
+    async def identify(self, data):
+        try:
+            self.shard = Shard(*data.get('shard', [0, 1]))
+        except ValueError:
+            await self.ws.close(code=4010, message=b'Invalid shard')
+            return
+
+        guild_ids = [guild_id for guild_id in self.fake.guilds if self.owns_guild(guild_id)]
+
+        await self.dispatch('READY', {
+            'v': 6,
+            'user': self.fake.bot,
+            'session_id': self.session_id,
+            'guilds': [{'id': guild_id, 'unavailable': True} for guild_id in guild_ids],
+            'private_channels': [],
+            'relationships': [],
+            '_trace': ['fake-discord'],
+        })
+
+        for guild_id in guild_ids:
+            await self.dispatch('GUILD_CREATE', self.fake.guild_payload(guild_id))
+
+    async def send_members(self, guild_id):
+        if not self.owns_guild(guild_id):
+            return
+
+        members = self.fake.member_payloads(guild_id)
+        for start in range(0, len(members), CHUNK_SIZE):
+            await self.dispatch('GUILD_MEMBERS_CHUNK', {'guild_id': guild_id, 'members': members[start:start + CHUNK_SIZE]})
+
+
+class FakeDiscord(object):
+    '''
+    A local stand-in for the Discord REST API and gateway, so the bot can be
+    load tested without a token or real guilds. The guilds, channels and
+    members are built from the database (see `load()`), the bot finds them
+    through the gateway like on Discord.
+
+    Every REST call takes `latency` seconds (plus up to `jitter`), answers
+    with a 429 with a chance of `rate_limit` and with a 500 with a chance of
+    `failure_rate`. More than `global_rate` calls in a second get a global
+    429 like Discord's global rate limit (0 disables it), and DMs to a
+    `closed_dms` fraction of the users are refused with a 403. All calls are
+    recorded, see `calls` and `stats()`.
+    '''
+
+    def __init__(self, latency=0.0, jitter=0.0, rate_limit=0.0, retry_after=1000, failure_rate=0.0,
+                 global_rate=50, closed_dms=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.failure_rate = failure_rate
+        self.global_rate = global_rate
+        self.closed_dms = closed_dms
+        self.random = random.Random(seed)
+
+        self._ids = itertools.count()
+        self.bot = {'id': self.snowflake(), 'username': 'StandupBot', 'discriminator': '0000', 'avatar': None, 'bot': True}
+
+        self.guilds = collections.OrderedDict()
+        self.members = {}
+        self.users = {}
+        self.channels = {}
+        self.dm_channels = {}
+        self.closed = set()
+
+        self.sessions = set()
+        self.calls = []
+        self._window = collections.deque()
+        self._runner = None
+
+    def snowflake(self):
+        return str(((int(time.time() * 1000) - DISCORD_EPOCH) << 22) | (next(self._ids) % 4096))
+
+    # Data
+
+    def add_guild(self, guild_id, name):
+        self.guilds[guild_id] = {'id': guild_id, 'name': name, 'channels': []}
+        self.members[guild_id] = set()
+
+    def add_channel(self, guild_id, channel_id, name):
+        guild = self.guilds.get(guild_id)
+        if not guild or not channel_id.isdigit():
+            return
+
+        channel = {'id': channel_id, 'type': 0, 'guild_id': guild_id, 'name': name, 'position': len(guild['channels'])}
+        guild['channels'].append(channel)
+        self.channels[channel_id] = channel
+
+    def add_user(self, user_id, name):
+        if not user_id.isdigit():
+            return
+
+        self.users[user_id] = {'id': user_id, 'username': name, 'discriminator': '%04d' % (int(user_id) % 10000), 'avatar': None}
+        if self.random.random() < self.closed_dms:
+            self.closed.add(user_id)
+
+    def add_member(self, guild_id, user_id):
+        if guild_id in self.guilds and user_id in self.users:
+            self.members[guild_id].add(user_id)
+
+    def load(self):
+        '''
+        Builds the guilds and their text channels from the servers and
+        channels in the database, every user attending a standup in a server
+        is a member of its guild.
+        '''
+        for guild_id, name in models.Server.objects.order_by('id').values_list('discord_guild_id', 'name'):
+            if guild_id.isdigit():
+                self.add_guild(guild_id, name)
+
+        for channel_id, guild_id, name in models.Channel.objects.order_by('id').values_list('discord_channel_id', 'server__discord_guild_id', 'name'):
+            self.add_channel(guild_id, channel_id, name)
+
+        for user_id, name in models.User.objects.filter(discord_id__isnull=False).order_by('id').values_list('discord_id', 'username'):
+            self.add_user(user_id, name)
+
+        for guild_id, user_id in models.Attendee.objects.values_list('standup__channel__server__discord_guild_id', 'user__discord_id').distinct():
+            self.add_member(guild_id, user_id)
+
+    def dm_channel(self, user_id):
+        if user_id not in self.dm_channels:
+            channel_id = self.snowflake()
+            self.dm_channels[user_id] = channel_id
+            self.channels[channel_id] = {'id': channel_id, 'type': 1, 'recipients': [self.users[user_id]], 'last_message_id': None}
+        return self.channels[self.dm_channels[user_id]]
+
+    def member_payloads(self, guild_id):
+        joined_at = _now()
+        users = [self.bot] + [self.users[user_id] for user_id in sorted(self.members[guild_id])]
+        return [{'user': user, 'roles': [], 'nick': None, 'joined_at': joined_at, 'deaf': False, 'mute': False} for user in users]
+
+    def guild_payload(self, guild_id):
+        guild = self.guilds[guild_id]
+        members = self.member_payloads(guild_id)
+        large = len(members) >= LARGE_THRESHOLD
+
+        return {
+            'id': guild_id,
+            'name': guild['name'],
+            'owner_id': self.bot['id'],
+            'unavailable': False,
+            'member_count': len(members),
+            'large': large,
+            'roles': [{'id': guild_id, 'name': '@everyone', 'permissions': 104324673, 'position': 0, 'color': 0,
+                       'hoist': False, 'managed': False, 'mentionable': False}],
+            'channels': guild['channels'],
+            # Like Discord, large guilds only send their members when requested
+            'members': members[:1] if large else members,
+            'presences': [],
+            'voice_states': [],
+            'emojis': [],
+            'features': [],
+        }
+
+    def message_payload(self, channel, content, author, embed=None, message_id=None, edited=False):
+        message = {
+            'id': message_id or self.snowflake(),
+            'type': 0,
+            'channel_id': channel['id'],
+            'author': author,
+            'content': content or '',
+            'timestamp': _now(),
+            'edited_timestamp': _now() if edited else None,
+            'tts': False,
+            'pinned': False,
+            'mention_everyone': False,
+            'mentions': [],
+            'mention_roles': [],
+            'attachments': [],
+            'embeds': [embed] if embed else [],
+        }
+        if 'guild_id' in channel:
+            message['guild_id'] = channel['guild_id']
+        return message
+
+    # Calls
+
+    def _record(self, request, status, started):
+        route = request.match_info.route.resource
+        call = {
+            'time': time.time(),
+            'method': request.method,
+            'route': route.canonical[len(API_PREFIX):] if route else request.path,
+            'status': status,
+            'duration': round(time.monotonic() - started, 6),
+        }
+        call.update(request.match_info)
+
+        # The recipient of a DM, to follow the notifications of a user
+        channel = self.channels.get(request.match_info.get('channel_id'))
+        if channel and channel['type'] == 1:
+            call['user_id'] = channel['recipients'][0]['id']
+
+        self.calls.append(call)
+
+    def _simulate_limits(self):
+        '''
+        Returns the error response of a simulated rate limit or failure, if any.
+        '''
+        if self.global_rate:
+            now = time.monotonic()
+            while self._window and self._window[0] <= now - 1:
+                self._window.popleft()
+
+            if len(self._window) >= self.global_rate:
+                retry_after = int((self._window[0] + 1 - now) * 1000) + 1
+                response = _json({'message': 'You are being rate limited.', 'retry_after': retry_after, 'global': True}, status=429)
+                response.headers['X-RateLimit-Global'] = 'true'
+                return response
+
+            self._window.append(now)
+
+        if self.random.random() < self.rate_limit:
+            return _json({'message': 'You are being rate limited.', 'retry_after': self.retry_after, 'global': False}, status=429)
+
+        if self.random.random() < self.failure_rate:
+            return _error(500, 0, '500: Internal Server Error')
+
+        return None
+
+    @web.middleware
+    async def middleware(self, request, handler):
+        if not request.path.startswith(API_PREFIX):
+            return await handler(request)
+
+        started = time.monotonic()
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+
+        try:
+            # Responses are mappings, an empty one is falsy
+            response = self._simulate_limits()
+            if response is None:
+                response = await handler(request)
+        except web.HTTPException as e:
+            self._record(request, e.status, started)
+            raise
+
+        self._record(request, response.status, started)
+        return response
+
+    def stats(self):
+        '''
+        Number of calls and mean duration by route and status, and the spread
+        of the DMs the users received.
+        '''
+        routes = {}
+        for call in self.calls:
+            key = '%s %s' % (call['method'], call['route'])
+            route = routes.setdefault(key, {'calls': 0, 'statuses': {}, 'duration': 0.0})
+            route['calls'] += 1
+            route['statuses'][str(call['status'])] = route['statuses'].get(str(call['status']), 0) + 1
+            route['duration'] += call['duration']
+
+        for route in routes.values():
+            route['mean_duration'] = round(route.pop('duration') / route['calls'], 6)
+
+        dms = [call for call in self.calls if 'user_id' in call and call['method'] == 'POST' and call['status'] == 200]
+
+        return {
+            'calls': len(self.calls),
+            'routes': routes,
+            'dms_sent': len(dms),
+            'users_messaged': len(set([call['user_id'] for call in dms])),
+            'first_dm_at': min([call['time'] for call in dms]) if dms else None,
+            'last_dm_at': max([call['time'] for call in dms]) if dms else None,
+            'gateway_sessions': len(self.sessions),
+        }
+
+    # REST API
+
+    async def get_gateway(self, request):
+        return _json({
+            'url': 'ws://%s/gateway' % request.host,
+            'shards': 1,
+            'session_start_limit': {'total': 1000, 'remaining': 1000, 'reset_after': 0},
+        })
+
+    async def get_me(self, request):
+        return _json(self.bot)
+
+    async def create_dm(self, request):
+        data = await request.json()
+        user_id = str(data.get('recipient_id'))
+        if user_id not in self.users:
+            return _error(400, 50033, 'Invalid Recipient(s)')
+        return _json(self.dm_channel(user_id))
+
+    async def send_message(self, request):
+        channel = self.channels.get(request.match_info['channel_id'])
+        if not channel:
+            return _error(404, 10003, 'Unknown Channel')
+
+        if channel['type'] == 1 and channel['recipients'][0]['id'] in self.closed:
+            return _error(403, 50007, 'Cannot send messages to this user')
+
+        data = await request.json()
+        return _json(self.message_payload(channel, data.get('content'), self.bot, embed=data.get('embed')))
+
+    async def edit_message(self, request):
+        channel = self.channels.get(request.match_info['channel_id'])
+        if not channel:
+            return _error(404, 10003, 'Unknown Channel')
+
+        data = await request.json()
+        return _json(self.message_payload(
+            channel, data.get('content'), self.bot, embed=data.get('embed'), message_id=request.match_info['message_id'], edited=True))
+
+    async def no_content(self, request):
+        if request.match_info['channel_id'] not in self.channels:
+            return _error(404, 10003, 'Unknown Channel')
+        return web.Response(status=204)
+
+    # Gateway
+
+    async def gateway(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+
+        session = GatewaySession(self, ws)
+        self.sessions.add(session)
+
+        try:
+            await session.send(HELLO, {'heartbeat_interval': HEARTBEAT_INTERVAL, '_trace': ['fake-discord']})
+            async for msg in ws:
+                if msg.type == aiohttp.WSMsgType.TEXT:
+                    await session.received(json.loads(msg.data))
+        finally:
+            self.sessions.discard(session)
+
+        return ws
+
+    # Control
+
+    async def get_calls(self, request):
+        since = int(request.query.get('since', 0))
+        return _json(self.calls[since:])
+
+    async def get_stats(self, request):
+        return _json(self.stats())
+
+    async def post_message(self, request):
+        '''
+        Makes a user send a message to the bot, in a DM unless a channel_id is
+        given, like `{"author_id": "...", "content": "!help"}`.
+        '''
+        data = await request.json()
+        author = self.users.get(str(data.get('author_id')))
+        if not author:
+            return _error(400, 0, 'Unknown author_id')
+
+        if data.get('channel_id'):
+            channel = self.channels.get(str(data['channel_id']))
+            if not channel or channel['type'] != 0:
+                return _error(404, 10003, 'Unknown Channel')
+            guild_id = channel['guild_id']
+        else:
+            channel = self.dm_channel(author['id'])
+            # DMs arrive on shard 0
+            guild_id = '0'
+
+        message = self.message_payload(channel, data.get('content'), author)
+        for session in list(self.sessions):
+            if session.owns_guild(guild_id):
+                if channel['type'] == 1:
+                    await session.dispatch('CHANNEL_CREATE', channel)
+                await session.dispatch('MESSAGE_CREATE', message)
+
+        return _json(message)
+
+    def app(self):
+        app = web.Application(middlewares=[self.middleware])
+        app.router.add_get(API_PREFIX + '/gateway', self.get_gateway)
+        app.router.add_get(API_PREFIX + '/gateway/bot', self.get_gateway)
+        app.router.add_get(API_PREFIX + '/users/@me', self.get_me)
+        app.router.add_post(API_PREFIX + '/users/@me/channels', self.create_dm)
+        app.router.add_post(API_PREFIX + '/channels/{channel_id}/messages', self.send_message)
+        app.router.add_patch(API_PREFIX + '/channels/{channel_id}/messages/{message_id}', self.edit_message)
+        app.router.add_delete(API_PREFIX + '/channels/{channel_id}/messages/{message_id}', self.no_content)
+        app.router.add_put(API_PREFIX + '/channels/{channel_id}/pins/{message_id}', self.no_content)
+        app.router.add_delete(API_PREFIX + '/channels/{channel_id}/pins/{message_id}', self.no_content)
+        app.router.add_get('/gateway', self.gateway)
+        app.router.add_get('/_fake/calls', self.get_calls)
+        app.router.add_get('/_fake/stats', self.get_stats)
+        app.router.add_post('/_fake/messages', self.post_message)
+        return app
+
+    async def start(self, host='127.0.0.1', port=8765):
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def stop(self):
+        if self._runner:
+            for session in list(self.sessions):
+                await session.ws.close()
+            await self._runner.cleanup()
@@ -1,4 +1,6 @@
 from django import forms
+from django.db import IntegrityError, transaction
+from django.db.models import Subquery
 from . import models
 
 
@@ -10,38 +12,67 @@ class StandupForm(forms.Form):
         super(StandupForm, self).__init__(*args, **kwargs)
 
         standup = self.participation.standup
-        prev_parti = models.StandupParticipation.objects.filter(
-            standup__event__standup_type=standup.event.standup_type,
-            standup__event__channel=standup.event.channel,
-            completed=True,
-            user=self.participation.user
-        ).exclude(id=self.participation.id).order_by('-id').first()
-        
-        answers = {}
+        self.questions = list(standup.event.standup_type.questions.all())
 
+        answers = {}
         if self.participation.completed:
-            answers = dict([(a.question, a.answer) for a in self.participation.answers.all()])
+            answers = dict(self.participation.answers.values_list('question_id', 'answer'))
+
+        # The last answers for all prefilled questions in one go
+        last_answers = {}
+        prefill = dict([(q.id, q.prefill_last_answer_id) for q in self.questions if q.prefill_last_answer_id])
+        if prefill and not self.participation.completed:
+            prev_parti = models.StandupParticipation.objects.filter(
+                standup__event__standup_type=standup.event.standup_type_id,
+                standup__event__channel=standup.event.channel_id,
+                completed=True,
+                user=self.participation.user_id
+            ).exclude(id=self.participation.id).order_by('-id')
+
+            last_answers = dict(models.StandupParticipationAnswer.objects.filter(
+                participation=Subquery(prev_parti.values('id')[:1]),
+                question__in=prefill.values()
+            ).values_list('question_id', 'answer'))
 
-        for question in participation.standup.event.standup_type.questions.all():
+        for question in self.questions:
             field_name = 'question_%d' % question.id
-            self.fields[field_name] = forms.CharField(required=False, label=question.question, initial=answers.get(question), widget=forms.Textarea())
+            self.fields[field_name] = forms.CharField(required=False, label=question.question, initial=answers.get(question.id), widget=forms.Textarea())
             if question.important:
                 self.fields[field_name].help_text = 'This field is optional, please leave it empty if it does not apply!'
 
-            if question.prefill_last_answer and prev_parti and not self.participation.completed:
-                lastans = prev_parti.answers.filter(question=question.prefill_last_answer).first()
-                if lastans:
-                    self.fields[field_name].initial = lastans.answer  
+            if prefill.get(question.id) in last_answers:
+                self.fields[field_name].initial = last_answers[prefill[question.id]]
 
     def save(self):
-        for question in self.participation.standup.event.standup_type.questions.all():
-            field_name = 'question_%d' % question.id
-            ans, created = self.participation.answers.get_or_create(question=question, defaults={'answer': self.cleaned_data[field_name]})
-            if not created:
-                ans.answer = self.cleaned_data[field_name]
-                ans.save()
+        with transaction.atomic():
+            # A double submit waits here until the first one is done, on a first
+            # submit there are no answer rows to lock yet
+            models.StandupParticipation.objects.select_for_update().get(pk=self.participation.pk)
+            existing = dict([(a.question_id, a) for a in self.participation.answers.all()])
+            created, updated = [], []
+
+            for question in self.questions:
+                answer = self.cleaned_data['question_%d' % question.id]
+                if question.id in existing:
+                    existing[question.id].answer = answer
+                    updated.append(existing[question.id])
+                else:
+                    created.append(models.StandupParticipationAnswer(participation=self.participation, question=question, answer=answer))
+
+            models.StandupParticipationAnswer.objects.bulk_update(updated, ['answer'])
+
+            try:
+                with transaction.atomic():
+                    models.StandupParticipationAnswer.objects.bulk_create(created)
+            except IntegrityError:
+                # SQLite has no row locks, a racing submit created some of the
+                # answers first. This one came last, so its answers win.
+                for answer in created:
+                    models.StandupParticipationAnswer.objects.update_or_create(
+                        participation=self.participation, question=answer.question, defaults={'answer': answer.answer})
 
-        self.participation.completed = True
-        self.participation.save()
+            # Also invalidates the cached page, bulk writes don't send signals
+            self.participation.completed = True
+            self.participation.save()
         
         return True
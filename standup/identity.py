@@ -0,0 +1,167 @@
+import collections
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models.signals import post_save, post_delete
+
+from standup import changefeed
+from standup import models
+
+
+class IdentityCache(object):
+    '''
+    Bounded LRU cache turning Discord snowflakes (user, guild and channel ID's)
+    into primary keys, so the bot doesn't need a `get_or_create` round trip
+    for every ID in every command. Entries are dropped through model signals
+    when the row is changed or deleted in this process, rows deleted by
+    another process (like the admin) are caught by `update_user` and
+    `retry_stale`.
+    '''
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def get(self, kind, discord_id):
+        key = (kind, str(discord_id))
+
+        with self._lock:
+            pk = self._data.get(key)
+            if pk is None:
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return pk
+
+    def set(self, kind, discord_id, pk):
+        key = (kind, str(discord_id))
+
+        with self._lock:
+            self._data[key] = pk
+            self._data.move_to_end(key)
+            self._keys[(kind, pk)] = key
+
+            while len(self._data) > self.maxsize:
+                (old_kind, _), old_pk = self._data.popitem(last=False)
+                self._keys.pop((old_kind, old_pk), None)
+
+    def invalidate(self, kind, pk):
+        with self._lock:
+            key = self._keys.pop((kind, pk), None)
+            if key:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._keys.clear()
+
+    def stats(self):
+        return {'size': len(self._data), 'hits': self.hits, 'misses': self.misses}
+
+    def user_id(self, discord_user):
+        '''
+        Returns the primary key of the user, creates the user if needed.
+        '''
+        pk = self.get('user', discord_user.id)
+
+        if pk is None:
+            user, _ = models.User.objects.get_or_create(
+                discord_id=discord_user.id,
+                defaults={
+                    'username': discord_user.id,
+                    'first_name': discord_user.display_name,
+                    'last_name': discord_user.discriminator
+                })
+            pk = user.pk
+            self.set('user', discord_user.id, pk)
+
+        return pk
+
+    def server_id(self, guild):
+        '''
+        Returns the primary key of the server, creates the server if needed.
+        '''
+        pk = self.get('server', guild.id)
+
+        if pk is None:
+            server, _ = models.Server.objects.get_or_create(discord_guild_id=guild.id, defaults={'name': guild.name})
+            pk = server.pk
+            self.set('server', guild.id, pk)
+
+        return pk
+
+    def channel_id(self, discord_channel):
+        '''
+        Returns the primary key of the channel, creates the channel and its server if needed.
+        '''
+        pk = self.get('channel', discord_channel.id)
+
+        if pk is None:
+            server_id = self.server_id(discord_channel.guild)
+            channel, _ = models.Channel.objects.get_or_create(discord_channel_id=discord_channel.id, server_id=server_id, defaults={'name': discord_channel.name})
+            pk = channel.pk
+            self.set('channel', discord_channel.id, pk)
+
+        return pk
+
+    def update_user(self, discord_user, **fields):
+        '''
+        Updates the given fields of the user and returns it. If the cached
+        user was deleted elsewhere it's resolved, and so created, again.
+        A queryset update sends no post_save signal, so the change is
+        published to the other bot processes here.
+        '''
+        pk = self.user_id(discord_user)
+
+        with transaction.atomic():
+            if not models.User.objects.filter(pk=pk).update(**fields):
+                self.invalidate('user', pk)
+                pk = self.user_id(discord_user)
+                models.User.objects.filter(pk=pk).update(**fields)
+
+            changefeed.publish('users', pk)
+
+        return models.User(pk=pk, **fields)
+
+    def retry_stale(self, func, *args, **kwargs):
+        '''
+        Runs `func` in a transaction. When it fails on a constraint, like a
+        foreign key to a cached row that was deleted elsewhere, the cache is
+        cleared and `func` runs once more with freshly resolved keys.
+        '''
+        try:
+            with transaction.atomic():
+                return func(*args, **kwargs)
+        except IntegrityError:
+            self.clear()
+
+        with transaction.atomic():
+            return func(*args, **kwargs)
+
+
+identities = IdentityCache(maxsize=settings.IDENTITY_CACHE_SIZE)
+
+
+def _receiver(kind, field):
+    def receiver(sender, instance, update_fields=None, **kwargs):
+        # Saves that don't touch the Discord ID can't make the entry stale
+        if update_fields is not None and field not in update_fields:
+            return
+        identities.invalidate(kind, instance.pk)
+    return receiver
+
+
+# Lazy senders, models.py imports this module before its models are defined
+for _model, _kind, _field in (('standup.User', 'user', 'discord_id'),
+                              ('standup.Server', 'server', 'discord_guild_id'),
+                              ('standup.Channel', 'channel', 'discord_channel_id')):
+    post_save.connect(_receiver(_kind, _field), sender=_model, weak=False, dispatch_uid='identity_cache_%s_save' % _kind)
+    post_delete.connect(_receiver(_kind, _field), sender=_model, weak=False, dispatch_uid='identity_cache_%s_delete' % _kind)
@@ -0,0 +1,96 @@
+import datetime
+import os
+import socket
+import time
+import uuid
+
+from django.db.models import DateTimeField, DurationField, ExpressionWrapper, F, Q, Value
+from django.db.models.functions import Now
+
+from standup import models
+
+
+class LeaseLost(Exception):
+    pass
+
+
+class Lease(object):
+    '''
+    Leader election for bot replicas on top of the `BotLease` table. The
+    holder renews the lease with a heartbeat, a standby takes it over once it
+    expired (or was released on shutdown). Expiry uses the database clock, so
+    clocks of different machines don't have to agree. Every takeover bumps
+    the fencing token, `fence()` makes sure a write only commits while the
+    lease is still held with the same token.
+    '''
+
+    def __init__(self, name, duration=15, holder=None):
+        self.name = name
+        self.duration = duration
+        self.holder = holder or '%s:%d:%s' % (socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        self.token = None
+        self._deadline = 0.0
+
+    def _expires(self):
+        return ExpressionWrapper(
+            Now() + Value(datetime.timedelta(seconds=self.duration), output_field=DurationField()),
+            output_field=DateTimeField())
+
+    def _mine(self):
+        return models.BotLease.objects.filter(name=self.name, holder=self.holder, token=self.token, expires_at__gt=Now())
+
+    @property
+    def held(self):
+        '''
+        True while the lease is held, according to the last heartbeat. Stops
+        a third of the duration before the lease could expire, so there's
+        time to finish the running work before a standby can take over.
+        '''
+        return self.token is not None and time.monotonic() < self._deadline
+
+    def heartbeat(self):
+        '''
+        Renews the lease, or takes it over when it's free or expired.
+        Returns True if this process holds the lease.
+        '''
+        started = time.monotonic()
+
+        if self.token is not None and self._mine().update(expires_at=self._expires(), heartbeat_at=Now()):
+            self._deadline = started + self.duration * 2 / 3.0
+            return True
+
+        self.token = None
+        models.BotLease.objects.bulk_create([models.BotLease(name=self.name)], ignore_conflicts=True)
+
+        taken = models.BotLease.objects.filter(name=self.name).filter(Q(expires_at__isnull=True) | Q(expires_at__lte=Now())).update(
+            holder=self.holder, token=F('token') + 1, expires_at=self._expires(), heartbeat_at=Now())
+
+        if not taken:
+            return False
+
+        # Only one of the competing updates can match, the row tells who won
+        lease = models.BotLease.objects.get(name=self.name)
+        if lease.holder != self.holder:
+            return False
+
+        self.token = lease.token
+        self._deadline = started + self.duration * 2 / 3.0
+        return True
+
+    def fence(self):
+        '''
+        Call inside the transaction of a write that may only happen while
+        holding the lease. Raises `LeaseLost` if it isn't held anymore. The
+        update locks the lease row, so a takeover waits for the transaction.
+        '''
+        if self.token is None or not self._mine().update(heartbeat_at=Now()):
+            self.token = None
+            raise LeaseLost('Lease %s is not held anymore' % self.name)
+
+    def release(self):
+        '''
+        Gives up the lease, so a standby can take over right away.
+        '''
+        if self.token is not None:
+            self._mine().update(holder='', expires_at=None)
+            self.token = None
@@ -0,0 +1,74 @@
+import datetime
+import json
+import platform
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from standup import synthetic
+from standup.benchmark import Benchmark
+
+
+class Command(BaseCommand):
+    help = 'Times the bot hot paths against a fake Discord client and prints the results as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--generate', action='store_true', help='Generate a synthetic dataset first, otherwise the existing data is used')
+        parser.add_argument('--servers', type=int, default=5)
+        parser.add_argument('--channels', type=int, default=20, help='Channels per server')
+        parser.add_argument('--types', type=int, default=2, help='Standup types')
+        parser.add_argument('--questions', type=int, default=4, help='Questions per standup type')
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--days', type=int, default=30, help='Days of standup history')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--latency', type=float, default=0.0, help='Seconds every fake Discord call takes')
+        parser.add_argument('--workers', type=int, default=8, help='Dispatcher workers')
+        parser.add_argument('--label', default='', help='Name of this run in the output, like a version')
+        parser.add_argument('--output', help='Write the JSON to this file instead of stdout')
+        parser.add_argument('--keep', action='store_true', help='Keep the changes instead of rolling them back, needs --generate')
+
+    def handle(self, *args, **options):
+        # The scenarios republish summaries and initiate standups, only keep
+        # that for a dataset of our own
+        if options['keep'] and not options['generate']:
+            raise CommandError('--keep needs --generate, the scenarios would change the existing data')
+
+        report = {
+            'label': options['label'],
+            'started_at': datetime.datetime.utcnow().isoformat() + 'Z',
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connections['default'].vendor,
+            'latency': options['latency'],
+            'workers': options['workers'],
+        }
+
+        # Everything is rolled back, so runs on the same data can be compared
+        try:
+            with transaction.atomic():
+                if options['generate']:
+                    report['dataset'] = synthetic.generate(
+                        servers=options['servers'],
+                        channels=options['channels'],
+                        types=options['types'],
+                        questions=options['questions'],
+                        users=options['users'],
+                        days=options['days'],
+                        seed=options['seed'])
+
+                prefix = report['dataset']['prefix'] if options['generate'] else None
+                report['results'] = Benchmark(latency=options['latency'], workers=options['workers'], prefix=prefix).run()
+
+                if not options['keep']:
+                    raise synthetic.Rollback()
+        except synthetic.Rollback:
+            pass
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
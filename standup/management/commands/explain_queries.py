@@ -0,0 +1,102 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.db.models import Count, Max, Q
+
+from standup import models
+from standup import synthetic
+
+
+class Command(BaseCommand):
+    help = 'Prints the query plan and timing of the hot queries on a synthetic dataset'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias to run against')
+        parser.add_argument('--servers', type=int, default=5)
+        parser.add_argument('--channels', type=int, default=20, help='Channels per server')
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--days', type=int, default=90)
+        parser.add_argument('--repeat', type=int, default=50, help='Times to run every query for the timing')
+        parser.add_argument('--keep', action='store_true', help="Keep the synthetic data instead of rolling it back")
+
+    def handle(self, *args, **options):
+        self.using = options['database']
+        self.repeat = options['repeat']
+        vendor = connections[self.using].vendor
+
+        try:
+            with transaction.atomic(using=self.using):
+                self.stdout.write('Generating synthetic data on %s (%s)...' % (self.using, vendor))
+                start = time.monotonic()
+                counts = synthetic.generate(
+                    servers=options['servers'],
+                    channels=options['channels'],
+                    users=options['users'],
+                    days=options['days'],
+                    seed=1,
+                    using=self.using)
+                self.stdout.write('Created %s in %.1f s' % (', '.join(['%d %s' % (v, k) for k, v in counts.items() if k != 'prefix']), time.monotonic() - start))
+
+                if vendor == 'postgresql':
+                    with connections[self.using].cursor() as cursor:
+                        cursor.execute('ANALYZE')
+
+                for name, qs in self.hot_queries(counts['prefix']):
+                    self.explain(name, qs)
+
+                if not options['keep']:
+                    raise synthetic.Rollback()
+        except synthetic.Rollback:
+            self.stdout.write('Rolled back the synthetic data')
+
+    def hot_queries(self, prefix):
+        db = self.using
+        participation = models.StandupParticipation.objects.using(db).filter(
+            standup__event__channel__server__slug__startswith=prefix
+        ).select_related('standup__event__channel__server').order_by('-id').first()
+        standup = participation.standup
+        listing = models.Standup.objects.using(db).filter(event__standup_type__private=False).order_by('-created_at', '-id')
+        listed = listing.count()
+
+        queries = [
+            ('Standup by event and date',
+             models.Standup.objects.using(db).filter(event=standup.event_id, standup_date=standup.standup_date)),
+            ('Active participants of a standup',
+             models.StandupParticipation.objects.using(db).filter(standup=standup, completed=True, read_only=False)),
+            ('Participation by token',
+             models.StandupParticipation.objects.using(db).filter(single_use_token=participation.single_use_token)),
+            ('Channel by server and slug',
+             models.Channel.objects.using(db).filter(server=standup.event.channel.server_id, slug=standup.event.channel.slug)),
+            ('Standups to publish',
+             models.StandupSummaryRebuild.objects.using(db).values_list('standup_id').annotate(Max('id')).order_by()),
+            ('Private listing page',
+             models.StandupParticipation.objects.using(db).filter(user=participation.user_id).order_by('-created_at', '-id')
+             .select_related('standup__event__channel__server', 'standup__event__standup_type')[:51]),
+        ]
+
+        # Without public standups there's no page to start from
+        if listed:
+            middle = listing[listed // 2]
+            queries.append(
+                ('Public listing page',
+                 listing.filter(Q(created_at__lt=middle.created_at) | Q(created_at=middle.created_at, id__lt=middle.pk))
+                 .select_related('event__channel__server', 'event__standup_type')
+                 .annotate(active_count=Count('participants', filter=Q(participants__completed=True, participants__read_only=False)))[:51]))
+
+        return queries
+
+    def explain(self, name, qs):
+        self.stdout.write('')
+        self.stdout.write(self.style.MIGRATE_HEADING(name))
+        self.stdout.write(qs.explain())
+
+        timings = []
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            list(qs.all())
+            timings.append(time.perf_counter() - start)
+
+        timings.sort()
+        self.stdout.write('avg %.3f ms, median %.3f ms, max %.3f ms over %d runs' % (
+            sum(timings) / len(timings) * 1000, timings[len(timings) // 2] * 1000, timings[-1] * 1000, len(timings)))
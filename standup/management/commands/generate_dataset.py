@@ -0,0 +1,32 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from standup import synthetic
+
+
+class Command(BaseCommand):
+    help = 'Fills the database with a synthetic dataset for benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias to fill')
+        parser.add_argument('--servers', type=int, default=5)
+        parser.add_argument('--channels', type=int, default=20, help='Channels per server')
+        parser.add_argument('--types', type=int, default=2, help='Standup types')
+        parser.add_argument('--questions', type=int, default=4, help='Questions per standup type')
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--days', type=int, default=30, help='Days of standup history')
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        counts = synthetic.generate(
+            servers=options['servers'],
+            channels=options['channels'],
+            types=options['types'],
+            questions=options['questions'],
+            users=options['users'],
+            days=options['days'],
+            seed=options['seed'],
+            using=options['database'])
+
+        self.stdout.write(json.dumps(counts, indent=2))
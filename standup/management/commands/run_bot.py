@@ -4,20 +4,170 @@ from django.core.management.base import BaseCommand, CommandError
 from discord.ext.commands import Bot, MemberConverter, errors
 import discord
 from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 import datetime
+import time
 from standup import models
-import pytz
+from standup.scheduler import StandupScheduler
+from standup.executor import DatabaseExecutor, LoopMonitor
+from standup.dispatcher import MessageDispatcher
+from standup.identity import identities
+from standup.changefeed import ChangeFeedListener
+from standup.timezones import TimezoneCatalog
+from standup.sharding import Shard
+from standup.lease import Lease, LeaseLost
+from standup import metrics
+
+
+# Seconds between summary polls when the change feed is used. Retries summaries
+# that weren't ready yet (like waiting for the public publish time) or failed.
+# The datagram feed is always polled at this interval too, it can't tell if a
+# notification got lost, like from a web process on another host that can't
+# reach it. PostgreSQL's LISTEN doesn't lose them, so it isn't polled while
+# there's nothing to retry.
+SUMMARY_RETRY_INTERVAL = 60
+
+# Seconds before due attendees are initiated again when that failed
+INITIATE_RETRY_DELAY = 10
+
+
+# The functions below do the database work for the bot, they are called
+# through the DatabaseExecutor so they never block the event loop.
+
+def get_standup_type(command_name):
+    '''
+    Returns the standup type and None, or None and a message listing all options.
+    '''
+    try:
+        return (models.StandupType.objects.get(command_name=command_name), None)
+    except models.StandupType.DoesNotExist:
+        msg = 'Please provide a valid standup type as the argument of this function, your options are:\n\n'
+        msg += '\n'.join(['`%s` (%s)' % (s.command_name, s.name) for s in models.StandupType.objects.all()])
+        return (None, msg)
+
+
+def set_timezone(discord_user, timezonename):
+    return identities.update_user(discord_user, timezone=timezonename)
+
+
+def set_mute_until(discord_user, until):
+    return identities.update_user(discord_user, mute_until=until)
+
+
+def last_standup_to_publish(stype, discord_channel_id):
+    today = timezone.now().date()
+    return models.Standup.objects.filter(
+        event__standup_type=stype, 
+        event__channel__discord_channel_id=discord_channel_id, 
+        event__standup_type__publish_to_channel=True, 
+        standup_date__lt=today
+    ).select_related('event__channel__server', 'event__standup_type').order_by('-id').first()
+
+
+def initiate_attendees(event_ids, lease):
+    '''
+    Initiates the standups of the given events for all their attendees, like
+    `StandupEvent.initiate`, so attendees that aren't due yet already get their
+    participation. Returns the Discord ID of every user to notify together with
+    the messages to send them. Raises `LeaseLost` without changing anything if
+    another replica took over.
+    '''
+    to_notify = []
+
+    with transaction.atomic():
+        lease.fence()
+        for ids in models.in_batches(event_ids):
+            to_notify.extend(models.StandupEvent.objects.initiate_attendees(models.Attendee.objects.filter(standup_id__in=ids)))
+
+    notifications = []
+
+    for participant in to_notify:
+        messages = []
+        if not participant.read_only:
+            messages.append('Please answer the questions for "%s" in "%s" here: %s - Thanks!' % (
+                participant.standup.event.standup_type.name, 
+                participant.standup.event.channel, 
+                participant.get_form_url(),))
+
+        messages.append('You can view your private standup overview here: %s' % (
+            participant.get_home_url(),))
+
+        notifications.append((int(participant.user.discord_id), messages))
+
+    return notifications
 
 
 class Command(BaseCommand):
     help = 'Runs the Discord Bot'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--db-pool-size', type=int, default=settings.BOT_DB_POOL_SIZE,
+            help='Number of threads doing database work, 0 runs it on the event loop')
+        parser.add_argument(
+            '--monitor-loop', action='store_true',
+            help='Periodically print how long the event loop was blocked')
+        parser.add_argument(
+            '--shard-count', type=int, default=settings.BOT_SHARD_COUNT,
+            help='Total number of bot processes, each one runs a Discord shard')
+        parser.add_argument(
+            '--shard-id', type=int, default=settings.BOT_SHARD_ID,
+            help='Shard of this process, from 0 up to the shard count')
+        parser.add_argument(
+            '--metrics-port', type=int, default=settings.BOT_METRICS_PORT,
+            help='Serve Prometheus metrics on this port, 0 disables it')
+        parser.add_argument(
+            '--discord-api', default=settings.DISCORD_API_URL,
+            help='Base URL of the Discord API, like the one of run_fake_discord, instead of Discord')
+
     def handle(self, *args, **options):
-        bot = Bot(command_prefix='!')
+        try:
+            shard = Shard(options['shard_id'], options['shard_count'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        # The gateway URL is asked from the API, so this moves the gateway too
+        if options['discord_api']:
+            discord.http.Route.BASE = options['discord_api'].rstrip('/')
+
+        if shard.sharded:
+            bot = Bot(command_prefix='!', shard_id=shard.shard_id, shard_count=shard.shard_count)
+        else:
+            bot = Bot(command_prefix='!')
+        db = DatabaseExecutor(max_workers=options['db_pool_size'])
+        dispatcher = MessageDispatcher(workers=settings.BOT_DISPATCH_WORKERS, rate=settings.BOT_DISPATCH_RATE)
+        scheduler = StandupScheduler(resync_interval=settings.SCHEDULER_RESYNC_INTERVAL, shard=shard)
+        scheduler.connect(bot.loop)
+
+        # Summaries to publish and schedule changes are pushed by the web process
+        summaries_changed = asyncio.Event()
+
+        def on_change(kind, pk):
+            if kind == 'summary':
+                summaries_changed.set()
+                scheduler.wake()
+            else:
+                scheduler.mark(kind, pk)
+
+        feed = ChangeFeedListener(on_change, shard_id=shard.shard_id)
+
+        # Replicas of the same shard stand by until the lease holder goes away
+        lease = Lease('run_bot:%s' % shard, duration=settings.BOT_LEASE_DURATION)
+
+        queries = metrics.QueryCounter()
+        queries.install_everywhere()
+        metrics.bot_registry.gauge('standup_bot_dispatch_queue_depth', 'Discord calls waiting or in flight', function=lambda: dispatcher.queue_depth)
+        metrics.bot_registry.gauge('standup_bot_scheduled_attendees', 'Attendees in the schedule of this shard', function=lambda: len(scheduler._entries))
+        metrics.bot_registry.gauge('standup_bot_lease_held', 'Whether this replica holds the lease of its shard', function=lambda: int(lease.held))
+        metrics.bot_registry.gauge('standup_bot_change_feed_listening', 'Whether the change feed is available', function=lambda: int(feed.listening))
+        metrics.bot_registry.gauge(
+            'standup_bot_identity_cache', 'Discord ID cache size, hits and misses', ('stat',),
+            function=lambda: dict([((k,), v) for k, v in identities.stats().items()]))
+        catalog = TimezoneCatalog()
 
         print('-----------------------------------')
-        print('Starting the bot...')
+        print('Starting the bot (shard %s)...' % shard)
 
         @bot.event
         async def on_ready():
@@ -25,6 +175,17 @@ class Command(BaseCommand):
             print('Bot logged in as %s (%s)' % (bot.user.name, bot.user.id))
             print('-----------------------------------')
         
+        @bot.check
+        async def holds_lease(ctx):
+            # A standby receives the same commands, only the lease holder answers
+            return lease.held
+
+        @bot.event
+        async def on_command_error(ctx, error):
+            if isinstance(error, errors.CheckFailure) and not lease.held:
+                return
+            await Bot.on_command_error(bot, ctx, error)
+
         bot.remove_command('help')
 
         @bot.command()
@@ -36,13 +197,13 @@ class Command(BaseCommand):
 
             embed = discord.Embed(title="**StandupBot Help**", description="These commands are available:")
             embed.add_field(name="**!timezones**", value="Shows all available timezones to pick from", inline=False)
-            embed.add_field(name="**!findtimezone <name>**", value="Shows all available timezones to pick from matching the given name, for easier lookup", inline=False)
+            embed.add_field(name="**!findtimezone <name>**", value="Shows the timezones best matching the given city, region or UTC offset (like `+2`), for easier lookup", inline=False)
             embed.add_field(name="**!settimezone <tz_name>**", value="Set a timezone from the `!timezones` list", inline=False)
             embed.add_field(name="**!mute_until <yyyy/mm/dd>**", value="Mute yourself from standup participation until a given date, good for vacations", inline=False)
             embed.add_field(name="**!newstandup <standup_type>**", value="Start a new standup for the channel you are in", inline=False)
             embed.add_field(name="**!addparticipant <standup_type> [readonly] <user 1> <user 2>...**", value="Add a new participant for a standup, optionally read only. You can add multiple add the same time", inline=False)
             
-            await ctx.author.send(embed=embed)
+            await dispatcher.send(ctx.author, embed=embed)
         
         @bot.command(name='sendsummary')
         async def sendsummary(ctx, standup_type):
@@ -50,26 +211,30 @@ class Command(BaseCommand):
             await ctx.message.delete()
 
             if not ctx.author.permissions_in(ctx.channel).manage_messages:
-                await ctx.author.send('Sorry, you have no permission to do this! Only users with the permission to manage messages for a given channel can do this.')
+                await dispatcher.send(ctx.author, 'Sorry, you have no permission to do this! Only users with the permission to manage messages for a given channel can do this.')
                 return
 
-            try:
-                stype = models.StandupType.objects.get(command_name=standup_type)
-            except models.StandupType.DoesNotExist:
-                msg = 'Please provide a valid standup type as the argument of this function, your options are:\n\n'
-                msg += '\n'.join(['`%s` (%s)' % (s.command_name, s.name) for s in models.StandupType.objects.all()])
-                await ctx.author.send(msg)
+            stype, msg = await db.run(get_standup_type, standup_type)
+            if not stype:
+                await dispatcher.send(ctx.author, msg)
                 return 
-            
-            today = timezone.now().date()
 
-            standup = models.Standup.objects.filter(event__standup_type=stype, event__channel__discord_channel_id=ctx.channel.id, event__standup_type__publish_to_channel=True, standup_date__lt=today).order_by('-id').first()
+            standup = await db.run(last_standup_to_publish, stype, ctx.channel.id)
 
             if standup:
-                await ctx.author.send('Sending summary for %s' % standup)
-                await standup.send_summary(bot)
+                await dispatcher.send(ctx.author, 'Sending summary for %s' % standup)
+                try:
+                    sent = await standup.send_summary(bot, db, dispatcher, lease)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print('Publishing the summary of %s failed: %r' % (standup, e))
+                    sent = False
+
+                if not sent:
+                    await dispatcher.send(ctx.author, 'Nothing to publish yet for %s, or some messages failed and will be retried' % standup)
             else:
-                await ctx.author.send('Standup not found, can\'t publish!')
+                await dispatcher.send(ctx.author, 'Standup not found, can\'t publish!')
 
         @bot.command(name='addparticipant')
         async def addparticipant(ctx, standup_type, *users):
@@ -79,48 +244,50 @@ class Command(BaseCommand):
             users = list(users)
             read_only = False
 
-            if users[0] == 'readonly':
+            if users and users[0] == 'readonly':
                 users.pop(0)
                 read_only = True
             
             if not ctx.author.permissions_in(ctx.channel).manage_messages:
-                await ctx.author.send('Sorry, you have no permission to do this! Only users with the permission to manage roles for a given channel can do this.')
+                await dispatcher.send(ctx.author, 'Sorry, you have no permission to do this! Only users with the permission to manage roles for a given channel can do this.')
                 return
 
-            try:
-                stype = models.StandupType.objects.get(command_name=standup_type)
-            except models.StandupType.DoesNotExist:
-                msg = 'Please provide a valid standup type as the argument of this function, your options are:\n\n'
-                msg += '\n'.join(['`%s` (%s)' % (s.command_name, s.name) for s in models.StandupType.objects.all()])
-                await ctx.author.send(msg)
+            stype, msg = await db.run(get_standup_type, standup_type)
+            if not stype:
+                await dispatcher.send(ctx.author, msg)
                 return 
 
-            members = []
-            failed = []
-            for user in users:
-                try:
-                    mem = await MemberConverter().convert(ctx, user)
-                except errors.BadArgument:
-                    continue
+            # Mentions resolve from the member cache, so converting them all at once is cheap
+            converted = await asyncio.gather(*[MemberConverter().convert(ctx, user) for user in users], return_exceptions=True)
 
-                success, reason = models.StandupEvent.objects.add_participant_from_discord(stype, ctx.channel, mem, ctx.author, read_only)
+            # Only a failed lookup means an unknown user, anything else is a real error
+            for mem in converted:
+                if isinstance(mem, Exception) and not isinstance(mem, errors.BadArgument):
+                    raise mem
 
-                if success:
-                    members.append(mem)
+            members = [mem for mem in converted if not isinstance(mem, Exception)]
+            unknown = [user for user, mem in zip(users, converted) if isinstance(mem, errors.BadArgument)]
 
-                if not success:
-                    failed.append((mem, reason))
+            event, added, already, reason = await db.run(identities.retry_stale, models.StandupEvent.objects.add_participants_from_discord, stype, ctx.channel, members, ctx.author, read_only)
 
+            if not event:
+                await dispatcher.send(ctx.channel, 'Failed to add participants to this standup, %s.' % reason)
+                return
 
-                print(success, reason)
-            
-            if members:
-                mstring = ', '.join(['<@%s>' % x.id for x in members])
-                await ctx.send('Added %s as participants of this standup!' % mstring)
+            if added:
+                scheduler.mark('events', event.pk)
+
+            # Report everything in a single message
+            lines = []
+            if added:
+                lines.append('Added %s as participants of this standup!' % ', '.join(['<@%s>' % x.id for x in added]))
+            if already:
+                lines.append('Already in this standup: %s.' % ', '.join(['<@%s>' % x.id for x in already]))
+            if unknown:
+                lines.append('Could not find: %s.' % ', '.join(['`%s`' % x for x in unknown]))
 
-            if failed:
-                for mem, reason in failed:
-                    await ctx.send('Failed to add <@%s> as participants of this standup, %s.' % (mem.id, reason))
+            if lines:
+                await dispatcher.send(ctx.channel, '\n'.join(lines))
 
 
 
@@ -132,30 +299,20 @@ class Command(BaseCommand):
             except discord.errors.Forbidden:
                 pass
 
-            await ctx.author.send('**You can choose from the following timezones:**')
-            
-            # looping over slices of all timezones, working around max. message length of Discord
-            for i in range((len(pytz.common_timezones) // 75) + 1):
-                tzs = pytz.common_timezones[i*75:i*75+75]
-                msg = '`%s`' % '`, `'.join(tzs)
-                await ctx.author.send(msg)
+            # Same route, the listing still arrives in order
+            sends = [dispatcher.send(ctx.author, '**You can choose from the following timezones:**')]
+            sends.extend([dispatcher.send(ctx.author, msg) for msg in catalog.listing()])
+            await asyncio.gather(*sends)
         
 
         @bot.command(name='findtimezone')
-        async def findtimezone(ctx, name):
+        async def findtimezone(ctx, *, name):
             try:
                 await ctx.message.delete()
             except discord.errors.Forbidden:
                 pass
 
-            await ctx.author.send('**Found the following timezones for `%s`:**' % name)
-            
-            # looping over slices of all timezones, working around max. message length of Discord
-            ftzs = [x for x in pytz.common_timezones if name.lower() in x.lower()]
-            for i in range((len(ftzs) // 75) + 1):
-                tzs = ftzs[i*75:i*75+75]
-                msg = '`%s`' % '`, `'.join(tzs)
-                await ctx.author.send(msg)
+            await dispatcher.send(ctx.author, catalog.search_message(name))
         
 
         @bot.command(name='settimezone')
@@ -165,21 +322,13 @@ class Command(BaseCommand):
             except discord.errors.Forbidden:
                 pass
 
-            if timezonename in pytz.common_timezones:
-                user, _ = models.User.objects.get_or_create(
-                    discord_id=ctx.author.id, 
-                    defaults={
-                        'username': ctx.author.id, 
-                        'first_name': ctx.author.display_name, 
-                        'last_name': ctx.author.discriminator
-                    })
+            if timezonename in catalog.by_name:
+                user = await db.run(set_timezone, ctx.author, timezonename)
+                scheduler.mark('users', user.pk)
 
-                user.timezone = timezonename
-                user.save()
-
-                await ctx.author.send('Thanks, your timezone has been set to %s' % user.timezone)
+                await dispatcher.send(ctx.author, 'Thanks, your timezone has been set to %s' % user.timezone)
             else:
-                await ctx.author.send('%s is a unknown timezone, please execute the `!timezones` command to see all avaiable timezones!' % timezonename)
+                await dispatcher.send(ctx.author, '%s is a unknown timezone, please execute the `!timezones` command to see all avaiable timezones!' % timezonename)
 
         @bot.command(name='mute_until')
         async def mute_until(ctx, date):
@@ -191,81 +340,172 @@ class Command(BaseCommand):
             try:
                 until = datetime.date(*[int(x) for x in date.split('/')])
             except:
-                await ctx.author.send('Unable to mute you, date format unknown. Please provide a date like this: YYYY/MM/DD, so for example `!mute_until 2020/01/01`')
-                
-            user, _ = models.User.objects.get_or_create(
-                discord_id=ctx.author.id, 
-                defaults={
-                    'username': ctx.author.id, 
-                    'first_name': ctx.author.display_name, 
-                    'last_name': ctx.author.discriminator
-                })
-            
-            user.mute_until = until
-            user.save()
+                await dispatcher.send(ctx.author, 'Unable to mute you, date format unknown. Please provide a date like this: YYYY/MM/DD, so for example `!mute_until 2020/01/01`')
+                return
 
-            await ctx.author.send('Thanks, you won\'t participate in standups until %s' % until)
+            user = await db.run(set_mute_until, ctx.author, until)
+            scheduler.mark('users', user.pk)
+
+            await dispatcher.send(ctx.author, 'Thanks, you won\'t participate in standups until %s' % until)
 
 
         @bot.command(name='newstandup')
         async def newstandup(ctx, standup_type):
             
-            try:
-                stype = models.StandupType.objects.get(command_name=standup_type)
-            except models.StandupType.DoesNotExist:
-                msg = 'Please provide a valid standup type as the argument of this function, your options are:\n\n'
-                msg += '\n'.join(['`%s` (%s)' % (s.command_name, s.name) for s in models.StandupType.objects.all()])
-                await ctx.author.send(msg)
+            stype, msg = await db.run(get_standup_type, standup_type)
+            if not stype:
+                await dispatcher.send(ctx.author, msg)
                 await ctx.message.delete()
                 return 
 
             if not ctx.author.permissions_in(ctx.channel).manage_messages:
-                await ctx.author.send('Sorry, you have no permission to do this! Only users with the permission to manage roles for a given channel can do this.')
+                await dispatcher.send(ctx.author, 'Sorry, you have no permission to do this! Only users with the permission to manage roles for a given channel can do this.')
             else:
-                if models.StandupEvent.objects.create_from_discord(stype, ctx.channel, ctx.author):
-                    await ctx.send('%s initialized for this channel!' % stype.name)
+                if await db.run(identities.retry_stale, models.StandupEvent.objects.create_from_discord, stype, ctx.channel, ctx.author):
+                    await dispatcher.send(ctx.channel, '%s initialized for this channel!' % stype.name)
                 else:
-                    await ctx.send('This channel already has a %s, no new one was created.' % stype.name)
+                    await dispatcher.send(ctx.channel, 'This channel already has a %s, no new one was created.' % stype.name)
 
 
             await ctx.message.delete()
 
 	    
+        def report_failure(future):
+            if not future.cancelled() and future.exception():
+                print('Something went wrong while sending form to the user: %s' % future.exception())
+
+        async def keep_lease():
+            while True:
+                was_held = lease.held
+                try:
+                    held = await db.run(lease.heartbeat)
+                except Exception as e:
+                    print('Lease heartbeat failed: %s' % e)
+                    held = False
+
+                if held and not was_held:
+                    print('Holding lease %s (token %d), running the periodic work' % (lease.name, lease.token))
+                    scheduler.wake()
+                elif was_held and not held:
+                    print('Lost lease %s, standing by' % lease.name)
+
+                await asyncio.sleep(lease.duration / 3.0)
+
         async def interval():
+            await feed.start(bot.loop)
             await asyncio.sleep(10)
+            last_poll = None
+            leading = False
+            retry_summaries = False
+
+            def poll_interval():
+                # Without the change feed summaries are polled like before
+                if not feed.listening:
+                    return 10
+                if retry_summaries or not feed.reliable:
+                    return SUMMARY_RETRY_INTERVAL
+                return None
 
-            tz = timezone.get_default_timezone()
-    
             while True:
-                # Repetitive task checks here
-                for ev in models.StandupEvent.objects.all():
-                    success, to_notify = ev.initiate()
-                    if success:
-                        for participant in to_notify:
-                            did = int(participant.user.discord_id)
-                            user = bot.get_user(did)
-                            try:
-
-                                if not participant.read_only:
-                                    await user.send('Please answer the questions for "%s" in "%s" here: %s - Thanks!' % (
-                                        participant.standup.event.standup_type.name, 
-                                        participant.standup.event.channel, 
-                                        participant.get_form_url(),))
-
-                                await user.send('You can view your private standup overview here: %s' % (
-                                participant.get_home_url(),))
-                            except Exception as e:
-                                print('Something went wrong while sending form to the user: %s' % e)
-
-                for standup in models.Standup.objects.filter(pinned_message_id__isnull=True, rebuild_message=True, event__standup_type__publish_to_channel=True):
-                    await standup.send_summary(bot)
-                                
-
-                await asyncio.sleep(10)
+                if not lease.held:
+                    leading = False
+                    await asyncio.sleep(1)
+                    continue
+
+                if not leading:
+                    # The previous holder moved the schedule on, start from the database
+                    await db.run(scheduler.rebuild)
+                    leading = True
+                    last_poll = None
+
+                tick_started = time.perf_counter()
+                tick_queries = queries.count
+
+                # Only initiate the events with attendees whose start time passed
+                await db.run(scheduler.refresh)
+                due = scheduler.pop_due()
+                notifications = []
+
+                if due:
+                    try:
+                        notifications = await db.run(initiate_attendees, set([att.standup_id for att in due]), lease)
+                    except LeaseLost as e:
+                        print(e)
+                        continue
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        # Otherwise they wait for their next standup day
+                        print('Initiating %d due attendees failed, retrying: %r' % (len(due), e))
+                        scheduler.retry(due, INITIATE_RETRY_DELAY)
+
+                metrics.bot_notified.inc(len(notifications))
+
+                # The DMs are sent concurrently in the background, failures are only reported
+                for did, messages in notifications:
+                    user = bot.get_user(did)
+                    if not user:
+                        print('Something went wrong while sending form to the user: %s not found' % did)
+                        continue
+
+                    for msg in messages:
+                        dispatcher.send(user, msg).add_done_callback(report_failure)
+
+                # With the change feed summaries are published right away when
+                # notified, the polls only catch what's left
+                now = bot.loop.time()
+                if summaries_changed.is_set() or last_poll is None or (poll_interval() and now - last_poll >= poll_interval()):
+                    summaries_changed.clear()
+                    last_poll = now
+                    retry_summaries = False
+
+                    for standup in await db.run(models.StandupSummaryRebuild.objects.pending_standups, shard):
+                        if not lease.held:
+                            break
+                        # One broken summary must not stop the others or the bot
+                        try:
+                            with metrics.bot_summary_duration.time():
+                                sent = await standup.send_summary(bot, db, dispatcher, lease)
+                        except LeaseLost as e:
+                            # The new holder publishes from here on
+                            print(e)
+                            break
+                        except asyncio.CancelledError:
+                            raise
+                        except Exception as e:
+                            print('Publishing the summary of %s failed: %r' % (standup, e))
+                            sent = False
+                        if sent:
+                            metrics.bot_summaries.inc()
+                        else:
+                            retry_summaries = True
+
+                metrics.bot_ticks.observe(time.perf_counter() - tick_started)
+                metrics.bot_tick_queries.observe(queries.count - tick_queries)
+
+                if dispatcher.queue_depth:
+                    dispatcher.report()
+
+                if poll_interval():
+                    await scheduler.wait(max(last_poll + poll_interval() - bot.loop.time(), 0))
+                else:
+                    # Only woken up by the change feed and the schedule
+                    await scheduler.wait(scheduler.resync_interval)
+
+        tasks = [bot.start(settings.DISCORD_TOKEN), keep_lease(), interval(), dispatcher.run()]
+
+        if options['monitor_loop']:
+            tasks.append(LoopMonitor().run())
+
+        if options['metrics_port']:
+            tasks.append(metrics.MetricsServer(options['metrics_port']).start())
 
         try:
-            bot.loop.run_until_complete(asyncio.gather(bot.start(settings.DISCORD_TOKEN), interval()))
+            bot.loop.run_until_complete(asyncio.gather(*tasks))
         except KeyboardInterrupt:
             bot.loop.run_until_complete(bot.logout())
         finally:
+            feed.stop()
+            lease.release()
             bot.loop.close()
+            db.shutdown()
@@ -0,0 +1,60 @@
+import asyncio
+import json
+
+from django.core.management.base import BaseCommand
+
+from standup.fakediscord import API_PREFIX, FakeDiscord
+
+
+class Command(BaseCommand):
+    help = 'Runs a local stand-in for the Discord API and gateway, to load test the bot without Discord'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', type=float, default=0.05, help='Seconds every API call takes')
+        parser.add_argument('--jitter', type=float, default=0.0, help='Up to this many seconds are added to the latency at random')
+        parser.add_argument('--rate-limit', type=float, default=0.0, help='Chance of answering a call with a 429')
+        parser.add_argument('--retry-after', type=int, default=1000, help='Milliseconds to wait after a simulated 429')
+        parser.add_argument('--failure-rate', type=float, default=0.0, help='Chance of answering a call with a 500')
+        parser.add_argument('--global-rate', type=int, default=50, help='Calls per second before the global rate limit hits, 0 disables it')
+        parser.add_argument('--closed-dms', type=float, default=0.0, help='Fraction of the users that refuse DMs')
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--duration', type=float, default=0, help='Stop after this many seconds, 0 runs until interrupted')
+        parser.add_argument('--record', help='Write every API call to this file as JSON lines when stopping')
+
+    def handle(self, *args, **options):
+        fake = FakeDiscord(
+            latency=options['latency'],
+            jitter=options['jitter'],
+            rate_limit=options['rate_limit'],
+            retry_after=options['retry_after'],
+            failure_rate=options['failure_rate'],
+            global_rate=options['global_rate'],
+            closed_dms=options['closed_dms'],
+            seed=options['seed'])
+        fake.load()
+
+        loop = asyncio.get_event_loop()
+        loop.run_until_complete(fake.start(options['host'], options['port']))
+
+        print('Fake Discord with %d guilds, %d channels and %d users on http://%s:%d' % (
+            len(fake.guilds), len(fake.channels), len(fake.users), options['host'], options['port']))
+        print('Run the bot with --discord-api http://%s:%d%s and any DISCORD_TOKEN' % (options['host'], options['port'], API_PREFIX))
+
+        try:
+            if options['duration']:
+                loop.run_until_complete(asyncio.sleep(options['duration']))
+            else:
+                loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            loop.run_until_complete(fake.stop())
+
+            if options['record']:
+                with open(options['record'], 'w') as f:
+                    for call in fake.calls:
+                        f.write(json.dumps(call) + '\n')
+
+            self.stdout.write(json.dumps(fake.stats(), indent=2, sort_keys=True))
@@ -0,0 +1,323 @@
+import asyncio
+import hmac
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+
+    escaped = [(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in pairs]
+    return '{%s}' % ','.join(['%s="%s"' % pair for pair in escaped])
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return repr(int(value))
+    return repr(value)
+
+
+class Metric(object):
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple([labels.get(name, '') for name in self.labels])
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, self.labels, key, value) for key, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.documentation), '# TYPE %s %s' % (self.name, self.kind)]
+        for name, label_names, key, value in self.samples():
+            extra = None
+            if isinstance(name, tuple):
+                name, extra = name
+            lines.append('%s%s %s' % (name, _format_labels(label_names, key, extra), _format_value(value)))
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    '''
+    A value that goes up and down, either set directly or read from
+    `function` (returning a number, or a dict of label value tuples to
+    numbers) every time the metrics are rendered.
+    '''
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labels=(), function=None):
+        super(Gauge, self).__init__(name, documentation, labels)
+        self.function = function
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self):
+        if self.function:
+            value = self.function()
+            values = value if isinstance(value, dict) else {(): value}
+            return [(self.name, self.labels, key, v) for key, v in sorted(values.items())]
+        return super(Gauge, self).samples()
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def samples(self):
+        samples = []
+        for _, label_names, key, (counts, total) in super(Histogram, self).samples():
+            for bound, count in zip(self.buckets, counts):
+                samples.append((('%s_bucket' % self.name, ('le', _format_value(float(bound)))), label_names, key, count))
+            samples.append(('%s_sum' % self.name, label_names, key, total))
+            samples.append(('%s_count' % self.name, label_names, key, counts[-1]))
+        return samples
+
+
+class _Timer(object):
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class Registry(object):
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs):
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    def render(self):
+        return '\n'.join([metric.render() for metric in self.metrics]) + '\n'
+
+
+# Every process only renders the families it updates
+web_registry = Registry()
+bot_registry = Registry()
+
+
+def scrape_allowed(address, authorization=None):
+    '''
+    Whether a scrape from the IP address, with the given Authorization
+    header, may read the metrics. Needs METRICS_ALLOWED_IPS or METRICS_TOKEN
+    to be configured, nobody may otherwise.
+    '''
+    if settings.METRICS_TOKEN and authorization and hmac.compare_digest(authorization, 'Bearer %s' % settings.METRICS_TOKEN):
+        return True
+    return address in settings.METRICS_ALLOWED_IPS
+
+
+def scrape_configured():
+    return bool(settings.METRICS_TOKEN or settings.METRICS_ALLOWED_IPS)
+
+
+class QueryCounter(object):
+    '''
+    Database execute wrapper counting the queries that pass through it.
+    '''
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install_everywhere(self):
+        '''
+        Counts the queries of every database connection this process opens,
+        including the ones of the bot's worker threads.
+        '''
+        def install(sender, connection, **kwargs):
+            if self not in connection.execute_wrappers:
+                connection.execute_wrappers.append(self)
+
+        connection_created.connect(install, weak=False, dispatch_uid='metrics_query_counter')
+        install(None, connection)
+
+
+# Web
+
+http_requests = web_registry.counter(
+    'standup_http_requests_total', 'Handled requests by view and status code', ('view', 'status'))
+http_duration = web_registry.histogram(
+    'standup_http_request_duration_seconds', 'Time spent handling a request by view', ('view',))
+http_queries = web_registry.histogram(
+    'standup_http_request_queries', 'Database queries per request by view', ('view',), buckets=QUERY_BUCKETS)
+
+
+class MetricsMiddleware(object):
+    '''
+    Records the latency and the number of queries of every request by view.
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = QueryCounter()
+        start = time.perf_counter()
+
+        with connection.execute_wrapper(queries):
+            response = self.get_response(request)
+
+        view = request.resolver_match.url_name if getattr(request, 'resolver_match', None) else 'unresolved'
+        http_requests.inc(view=view, status=response.status_code)
+        http_duration.observe(time.perf_counter() - start, view=view)
+        http_queries.observe(queries.count, view=view)
+        return response
+
+
+def metrics_view(request):
+    # Not there at all unless enabled, and only for the configured scrapers
+    if not scrape_allowed(request.META.get('REMOTE_ADDR'), request.META.get('HTTP_AUTHORIZATION')):
+        raise Http404('Not found')
+    return HttpResponse(web_registry.render(), content_type=CONTENT_TYPE)
+
+
+# Bot
+
+bot_ticks = bot_registry.histogram(
+    'standup_bot_tick_duration_seconds', 'Duration of a scheduling and publishing round of the bot')
+bot_tick_queries = bot_registry.histogram(
+    'standup_bot_tick_queries', 'Database queries per round of the bot, including commands handled meanwhile', buckets=QUERY_BUCKETS)
+bot_notified = bot_registry.counter(
+    'standup_bot_notifications_total', 'Participants the bot sent the standup form to')
+bot_summaries = bot_registry.counter(
+    'standup_bot_summaries_published_total', 'Summaries sent or updated in their channel')
+bot_summary_duration = bot_registry.histogram(
+    'standup_bot_summary_duration_seconds', 'Time to build and send or update a summary')
+dispatch_latency = bot_registry.histogram(
+    'standup_bot_dispatch_seconds', 'Time from queueing a Discord call until it is done, by route kind (user is a DM)', ('route',))
+dispatch_errors = bot_registry.counter(
+    'standup_bot_dispatch_errors_total', 'Discord calls that failed after all retries, by route kind', ('route',))
+dispatch_retries = bot_registry.counter(
+    'standup_bot_dispatch_retries_total', 'Retried Discord calls, by route kind', ('route',))
+
+
+class MetricsServer(object):
+    '''
+    Minimal HTTP listener serving a registry on `/metrics` from the bot's
+    event loop, so Prometheus can scrape a process without a web framework.
+    Enabling it is opt-in through the port. Unless METRICS_ALLOWED_IPS or
+    METRICS_TOKEN is configured it only listens on 127.0.0.1, otherwise only
+    those scrapers are let in.
+    '''
+
+    def __init__(self, port, host=None, registry=bot_registry):
+        if host is None:
+            host = '0.0.0.0' if scrape_configured() else '127.0.0.1'
+
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        print('Serving metrics on http://%s:%d/metrics' % (self.host, self.port))
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            authorization = None
+            while True:
+                line = await asyncio.wait_for(reader.readline(), 5)
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                if name.strip().lower() == 'authorization':
+                    authorization = value.strip()
+
+            peer = writer.get_extra_info('peername')
+            address = peer[0] if peer else None
+
+            parts = request_line.decode('latin-1').split()
+            if scrape_configured() and not scrape_allowed(address, authorization):
+                status, body, content_type = '403 Forbidden', b'Forbidden\n', 'text/plain'
+            elif len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+                status, body, content_type = '200 OK', self.registry.render().encode('utf-8'), CONTENT_TYPE
+            else:
+                status, body, content_type = '404 Not Found', b'Not found\n', 'text/plain'
+
+            writer.write(('HTTP/1.1 %s\r\nContent-Type: %s\r\nContent-Length: %d\r\nConnection: close\r\n\r\n' % (
+                status, content_type, len(body))).encode('latin-1') + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def stop(self):
+        if self._server:
+            self._server.close()
@@ -0,0 +1,28 @@
+# Generated by Django 2.2.6 on 2026-10-18 14:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('standup', '0018_standuptype_minimum_days_between_standups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StandupSummaryMessage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField()),
+                ('discord_message_id', models.CharField(max_length=255)),
+                ('content', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('standup', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='summary_messages', to='standup.Standup')),
+            ],
+            options={
+                'unique_together': {('standup', 'position')},
+            },
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 2.2.6 on 2026-10-18 15:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_listings(apps, schema_editor):
+    StandupEvent = apps.get_model('standup', 'StandupEvent')
+    StandupParticipation = apps.get_model('standup', 'StandupParticipation')
+    PublicChannelListing = apps.get_model('standup', 'PublicChannelListing')
+    UserChannelListing = apps.get_model('standup', 'UserChannelListing')
+
+    PublicChannelListing.objects.bulk_create([
+        PublicChannelListing(channel_id=channel_id, standup_type_id=standup_type_id)
+        for channel_id, standup_type_id in StandupEvent.objects.filter(standups__isnull=False).values_list('channel_id', 'standup_type_id').distinct()
+    ])
+
+    UserChannelListing.objects.bulk_create([
+        UserChannelListing(user_id=user_id, channel_id=channel_id)
+        for user_id, channel_id in StandupParticipation.objects.values_list('user_id', 'standup__event__channel_id').order_by().distinct()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('standup', '0019_standupsummarymessage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserChannelListing',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('channel', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='user_listings', to='standup.Channel')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='channel_listings', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'channel')},
+            },
+        ),
+        migrations.CreateModel(
+            name='PublicChannelListing',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('channel', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='public_listings', to='standup.Channel')),
+                ('standup_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='channel_listings', to='standup.StandupType')),
+            ],
+            options={
+                'unique_together': {('channel', 'standup_type')},
+            },
+        ),
+        migrations.RunPython(fill_listings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 2.2.6 on 2026-10-18 15:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('standup', '0020_channel_listings'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='standupparticipation',
+            name='single_use_token',
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='channel',
+            index=models.Index(fields=['server', 'slug'], name='channel_server_slug_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='standup',
+            index=models.Index(fields=['event', 'standup_date'], name='standup_event_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='standup',
+            index=models.Index(fields=['created_at', 'id'], name='standup_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='standupparticipation',
+            index=models.Index(fields=['standup', 'completed', 'read_only'], name='participation_state_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='standupparticipation',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='participation_user_idx'),
+        ),
+    ]
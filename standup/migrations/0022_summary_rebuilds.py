@@ -0,0 +1,37 @@
+# Generated by Django 2.2.6 on 2026-10-18 16:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def mark_rebuilds(apps, schema_editor):
+    Standup = apps.get_model('standup', 'Standup')
+    StandupSummaryRebuild = apps.get_model('standup', 'StandupSummaryRebuild')
+
+    StandupSummaryRebuild.objects.bulk_create([
+        StandupSummaryRebuild(standup_id=standup_id)
+        for standup_id in Standup.objects.filter(rebuild_message=True).values_list('id', flat=True)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('standup', '0021_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StandupSummaryRebuild',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('standup', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='summary_rebuilds', to='standup.Standup')),
+            ],
+        ),
+        migrations.RunPython(mark_rebuilds, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='standup',
+            name='rebuild_message',
+        ),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.conf import settings
 from django.utils import timezone
@@ -9,8 +9,12 @@ from django.contrib.sites.models import Site
 from django.utils import timezone
 from timezone_field import TimeZoneField
 from django.utils.text import slugify
+import asyncio
 import datetime
 
+# identity.py imports this module in turn, so only import the module itself
+from standup import identity
+
 
 class User(AbstractUser):
     discord_id = models.CharField(max_length=255, null=True, blank=True)
@@ -44,6 +48,11 @@ class Channel(models.Model):
     slug = models.SlugField(null=True, blank=True)
     discord_channel_id = models.CharField(max_length=255, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['server', 'slug'], name='channel_server_slug_idx'),
+        ]
     
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -124,6 +133,20 @@ class StandupQuestion(OrderedModel):
         return '%s -> %s' % (self.standup_type, self.question)
 
 
+# SQLite allows 999 variables per query, `__in` lookups on sets that grow with
+# the number of users are split into batches of this size
+IN_BATCH_SIZE = 500
+
+
+def in_batches(values, size=IN_BATCH_SIZE):
+    '''
+    Splits the values up into lists for `__in` lookups of at most `size` values.
+    '''
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
 class StandupEventManager(models.Manager):
     
     def create_from_discord(self, standup_type, discord_channel, discord_user):
@@ -132,92 +155,228 @@ class StandupEventManager(models.Manager):
         they already exists and creates the corrosponding Standup Event 
         if it's not there yet.
         '''
-        user, _ = User.objects.get_or_create(discord_id=discord_user.id, defaults={'username': discord_user.id, 'first_name': discord_user.display_name, 'last_name': discord_user.discriminator})
-        server, _ = Server.objects.get_or_create(discord_guild_id=discord_channel.guild.id, defaults={'name': discord_channel.guild.name})
-        channel, _ = Channel.objects.get_or_create(discord_channel_id=discord_channel.id, server=server, defaults={'name': discord_channel.name})
+        user_id = identity.identities.user_id(discord_user)
+        channel_id = identity.identities.channel_id(discord_channel)
         
-        if StandupEvent.objects.filter(channel=channel, standup_type=standup_type).exists():
+        if StandupEvent.objects.filter(channel_id=channel_id, standup_type=standup_type).exists():
             return False
 
-        StandupEvent(channel=channel, standup_type=standup_type, created_by=user).save()
+        StandupEvent(channel_id=channel_id, standup_type=standup_type, created_by_id=user_id).save()
         return True
     
     def add_participant_from_discord(self, standup_type, discord_channel, discord_user, creating_discord_user, read_only=False):
         '''
         Add a Discord user to a Standup, creates the user if needed.
         '''
-        user, _ = User.objects.get_or_create(discord_id=discord_user.id, defaults={'username': discord_user.id, 'first_name': discord_user.display_name, 'last_name': discord_user.discriminator})
-        creating_user, _ = User.objects.get_or_create(discord_id=creating_discord_user.id, defaults={'username': creating_discord_user.id, 'first_name': creating_discord_user.display_name, 'last_name': creating_discord_user.discriminator})
-        server, _ = Server.objects.get_or_create(discord_guild_id=discord_channel.guild.id, defaults={'name': discord_channel.guild.name})
-        channel, _ = Channel.objects.get_or_create(discord_channel_id=discord_channel.id, server=server, defaults={'name': discord_channel.name})
+        user_id = identity.identities.user_id(discord_user)
+        creating_user_id = identity.identities.user_id(creating_discord_user)
+        channel_id = identity.identities.channel_id(discord_channel)
         
-        qs = StandupEvent.objects.filter(channel=channel, standup_type=standup_type)
+        event = StandupEvent.objects.filter(channel_id=channel_id, standup_type=standup_type).first()
 
-        if not qs.exists():
+        if not event:
             return (False, 'No standup available for this channel with this name')
 
-        event = qs.first()
-
-        att, created = event.attending.get_or_create(user=user, defaults={'created_by': creating_user, 'read_only': read_only})
+        att, created = event.attending.get_or_create(user_id=user_id, defaults={'created_by_id': creating_user_id, 'read_only': read_only})
         
         if created:
             return (True, None)
         else:
             return (False, 'Already in this standup!')
 
+    def add_participants_from_discord(self, standup_type, discord_channel, discord_users, creating_discord_user, read_only=False):
+        '''
+        Batch version of `add_participant_from_discord`, resolves all Discord
+        users at once and adds the missing ones in a single insert. Returns the
+        event with the added and already attending Discord users, or None and
+        the reason it failed: (event, added, already, reason).
+        '''
+        creating_user_id = identity.identities.user_id(creating_discord_user)
+        channel_id = identity.identities.channel_id(discord_channel)
 
+        event = StandupEvent.objects.filter(channel_id=channel_id, standup_type=standup_type).first()
 
-class StandupEvent(models.Model):
-    channel = models.ForeignKey('Channel', on_delete=models.CASCADE, related_name='standups')
-    standup_type = models.ForeignKey('StandupType', on_delete=models.PROTECT, related_name='standups')
-    created_by = models.ForeignKey('User', on_delete=models.PROTECT, related_name='created_standups')
-    created_at = models.DateTimeField(auto_now_add=True)
+        if not event:
+            return (None, [], [], 'No standup available for this channel with this name')
 
-    objects = StandupEventManager()
+        discord_users = list(dict([(str(u.id), u) for u in discord_users]).values())
+        user_ids = {}
+        missing = {}
 
-    def initiate(self):
+        for du in discord_users:
+            pk = identity.identities.get('user', du.id)
+            if pk is None:
+                missing[str(du.id)] = du
+            else:
+                user_ids[str(du.id)] = pk
+
+        if missing:
+            for discord_id, pk in User.objects.filter(discord_id__in=missing.keys()).values_list('discord_id', 'id'):
+                user_ids.setdefault(discord_id, pk)
+
+            new_users = [User(username=did, discord_id=did, first_name=du.display_name, last_name=du.discriminator) for did, du in missing.items() if did not in user_ids]
+            if new_users:
+                User.objects.bulk_create(new_users)
+                for discord_id, pk in User.objects.filter(discord_id__in=[u.discord_id for u in new_users]).values_list('discord_id', 'id'):
+                    user_ids.setdefault(discord_id, pk)
+
+            for discord_id in missing:
+                identity.identities.set('user', discord_id, user_ids[discord_id])
+
+        attending = set(event.attending.filter(user_id__in=user_ids.values()).values_list('user_id', flat=True))
+
+        added = []
+        already = []
+        for du in discord_users:
+            if user_ids[str(du.id)] in attending:
+                already.append(du)
+            else:
+                added.append(du)
+
+        Attendee.objects.bulk_create([
+            Attendee(standup=event, user_id=user_ids[str(du.id)], created_by_id=creating_user_id, read_only=read_only) for du in added])
+
+        return (event, added, already, None)
+
+    def initiate_attendees(self, attendees, now=None):
         '''
-        Initialize a daily standup if there's no one yet and if the conditions for creating one are met.
-        Returns True with the participant objects if it succeeded, False and None if there already was a event.
+        Bulk version of `StandupEvent.initiate`, works on a queryset of attendees
+        spread over any number of events with a fixed number of queries per
+        `IN_BATCH_SIZE` events or participations.
+        Returns the participations that should be notified.
         '''
+        if not now:
+            now = timezone.now()
 
-        att_users = []
+        attendees = attendees.filter(active=True).select_related('user', 'standup__standup_type').order_by('standup_id', 'id')
 
-        for att in self.attending.filter(active=True):
-            aware_dt = timezone.localtime(timezone=att.user.timezone)
-            s = self.standups.filter(standup_date=aware_dt.date()).first()
+        candidates = []
+        for att in attendees:
+            aware_dt = timezone.localtime(now, timezone=att.user.timezone)
 
             # Don't create a participant if it's not a standup day
-            if not self.standup_type.in_timeslot(aware_dt):
+            if not att.standup.standup_type.in_timeslot(aware_dt):
                 continue
-            
-            # Don't create a standup if the minimum days have not passed yet
-            if not s and self.standup_type.minimum_days_between_standups > 0:
-                treshold = aware_dt - datetime.timedelta(days=self.standup_type.minimum_days_between_standups)
-                if self.standups.filter(standup_date__gte=treshold.date()).exists():
-                    continue
-
 
             # Don't create a participant if muted
             if att.user.mute_until and att.user.mute_until >= aware_dt.date():
                 continue
-            
-            if not s:
-                s = Standup(event=self, standup_date=aware_dt.date())
-                s.save()
-            
-            # Skip users that are already created / received a notification
-            if not s or StandupParticipation.objects.filter(standup=s, user=att.user, notified=True).exists():
-                continue
 
-            p, created = StandupParticipation.objects.get_or_create(standup=s, user=att.user, defaults={'read_only': att.read_only})
+            candidates.append((att, aware_dt))
+
+        if not candidates:
+            return []
+
+        with transaction.atomic():
+            # Fetch every standup that's needed for either the lookup or the minimum days check
+            first_date = min([(aware_dt - datetime.timedelta(days=max(att.standup.standup_type.minimum_days_between_standups, 0))).date() for att, aware_dt in candidates])
+            event_ids = set([att.standup_id for att, _ in candidates])
+
+            standups = {}
+            dates = dict([(event_id, []) for event_id in event_ids])
+            for ids in in_batches(event_ids):
+                for s in Standup.objects.filter(event_id__in=ids, standup_date__gte=first_date).order_by('id'):
+                    standups.setdefault((s.event_id, s.standup_date), s)
+                    dates[s.event_id].append(s.standup_date)
+
+            planned = []
+            new_standups = []
+            for att, aware_dt in candidates:
+                key = (att.standup_id, aware_dt.date())
+                min_days = att.standup.standup_type.minimum_days_between_standups
+
+                # Don't create a standup if the minimum days have not passed yet
+                if key not in standups and min_days > 0:
+                    treshold = aware_dt - datetime.timedelta(days=min_days)
+                    if [d for d in dates[att.standup_id] if d >= treshold.date()]:
+                        continue
+
+                if key not in standups:
+                    standups[key] = Standup(event_id=att.standup_id, standup_date=aware_dt.date())
+                    dates[att.standup_id].append(aware_dt.date())
+                    new_standups.append(standups[key])
+
+                planned.append((att, aware_dt, key))
+
+            if new_standups:
+                Standup.objects.bulk_create(new_standups)
+                PublicChannelListing.objects.record_standups(new_standups)
+
+                # Not every database returns the primary keys on a bulk insert
+                if [s for s in new_standups if s.pk is None]:
+                    new_dates = set([s.standup_date for s in new_standups])
+                    for ids in in_batches(set([s.event_id for s in new_standups])):
+                        for s in Standup.objects.filter(event_id__in=ids, standup_date__in=new_dates).order_by('-id'):
+                            if standups[(s.event_id, s.standup_date)].pk is None:
+                                standups[(s.event_id, s.standup_date)] = s
+
+            # Read back per standup, a user list would be as long as the whole morning
+            existing = {}
+            for ids in in_batches(set([standups[key].pk for _, _, key in planned])):
+                for p in StandupParticipation.objects.filter(standup_id__in=ids).order_by('-id'):
+                    existing[(p.standup_id, p.user_id)] = p
+
+            new_participations = []
+            notify_ids = []
+            notify_tokens = []
+            for att, aware_dt, key in planned:
+                s = standups[key]
+                p = existing.get((s.pk, att.user_id))
+
+                # Skip users that already received a notification
+                if p and p.notified:
+                    continue
+
+                notify = aware_dt.time() > att.standup.standup_type.create_new_event_at
+
+                if not p:
+                    p = StandupParticipation(
+                        standup=s,
+                        user=att.user,
+                        read_only=att.read_only,
+                        single_use_token=get_random_string(length=48),
+                        notified=notify)
+                    existing[(s.pk, att.user_id)] = p
+                    new_participations.append(p)
+                    if notify:
+                        notify_tokens.append(p.single_use_token)
+                elif notify:
+                    p.notified = True
+                    notify_ids.append(p.pk)
+
+            if new_participations:
+                StandupParticipation.objects.bulk_create(new_participations)
+                UserChannelListing.objects.record_participations(new_participations)
+
+            for ids in in_batches(notify_ids):
+                StandupParticipation.objects.filter(id__in=ids).update(notified=True)
+
+        participations = StandupParticipation.objects.select_related('user', 'standup__event__standup_type', 'standup__event__channel__server')
+
+        to_notify = []
+        for ids in in_batches(notify_ids):
+            to_notify.extend(participations.filter(id__in=ids))
+        for tokens in in_batches(notify_tokens):
+            to_notify.extend(participations.filter(single_use_token__in=tokens))
+
+        return sorted(to_notify, key=lambda p: p.id)
+
+
+
+class StandupEvent(models.Model):
+    channel = models.ForeignKey('Channel', on_delete=models.CASCADE, related_name='standups')
+    standup_type = models.ForeignKey('StandupType', on_delete=models.PROTECT, related_name='standups')
+    created_by = models.ForeignKey('User', on_delete=models.PROTECT, related_name='created_standups')
+    created_at = models.DateTimeField(auto_now_add=True)
 
-            if aware_dt.time() > self.standup_type.create_new_event_at and not p.notified:
-                att_users.append(p)
-                p.notified = True
-                p.save()
+    objects = StandupEventManager()
 
-        return (True, att_users)
+    def initiate(self):
+        '''
+        Initialize a daily standup if there's no one yet and if the conditions for creating one are met.
+        Returns True with the participant objects if it succeeded, False and None if there already was a event.
+        '''
+        return (True, StandupEvent.objects.initiate_attendees(self.attending.all()))
 
 
     def __str__(self):
@@ -233,14 +392,101 @@ class Attendee(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
 
+DISCORD_MESSAGE_LIMIT = 2000
+
+
+def split_block(block, limit=DISCORD_MESSAGE_LIMIT):
+    '''
+    Splits a block that's longer than the limit, at the last line break that
+    fits or else the last space, so lines and mentions stay intact. Only a
+    single word longer than the limit is cut at the limit.
+    '''
+    pieces = []
+
+    while len(block) > limit:
+        cut = block.rfind('\n', 0, limit + 1)
+        if cut <= 0:
+            cut = block.rfind(' ', 0, limit + 1)
+
+        if cut <= 0:
+            pieces.append(block[:limit])
+            block = block[limit:]
+        else:
+            pieces.append(block[:cut])
+            block = block[cut + 1:]
+
+    pieces.append(block)
+    return pieces
+
+
+def pack_messages(blocks, limit=DISCORD_MESSAGE_LIMIT):
+    '''
+    Packs text blocks into as few Discord messages as possible, blocks are
+    only split up (with `split_block`) when a single block is longer than
+    the limit.
+    '''
+    messages = []
+    current = ''
+
+    for block in blocks:
+        if len(block) > limit:
+            if current:
+                messages.append(current)
+                current = ''
+            pieces = split_block(block, limit)
+            messages.extend(pieces[:-1])
+            block = pieces[-1]
+
+        if current and len(current) + len(block) + 1 > limit:
+            messages.append(current)
+            current = ''
+
+        current = '%s\n%s' % (current, block) if current else block
+
+    if current:
+        messages.append(current)
+
+    return messages
+
+
+def find_neighbours(instance, siblings):
+    '''
+    Returns the rows right before and after the instance in `siblings` (by ID)
+    with a single query, each of them None if there is none.
+    '''
+    previous = siblings.filter(id__lt=instance.id).order_by('-id').values('id')[:1]
+    following = siblings.filter(id__gt=instance.id).order_by('id').values('id')[:1]
+    found = list(siblings.filter(models.Q(id=models.Subquery(previous)) | models.Q(id=models.Subquery(following))))
+
+    return (
+        next((row for row in found if row.id < instance.id), None),
+        next((row for row in found if row.id > instance.id), None),
+    )
+
+
+def _not_found(error):
+    # discord.NotFound, without importing discord.py into the web process
+    return getattr(error, 'status', None) == 404
+
+
 class Standup(models.Model):
     event = models.ForeignKey('StandupEvent', on_delete=models.PROTECT, related_name='standups')
     standup_date = models.DateField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     pinned_message_id = models.CharField(max_length=255, null=True, blank=True)
-    rebuild_message = models.BooleanField(default=False)
 
-    async def send_summary(self, bot):
+    class Meta:
+        indexes = [
+            models.Index(fields=['event', 'standup_date'], name='standup_event_date_idx'),
+            models.Index(fields=['created_at', 'id'], name='standup_created_idx'),
+        ]
+
+    def build_summary(self):
+        '''
+        Renders the summary messages for the channel, returns the Discord
+        channel ID and a list of messages, or None if there's nothing to send yet.
+        Does all the database work so it can run outside of the bot's event loop.
+        '''
         standup = self
         tz = timezone.get_default_timezone()
         # Check for the public notification release date
@@ -253,31 +499,37 @@ class Standup(models.Model):
             tzinfo=tz)
 
         notify_date = startdate + standup.event.standup_type.public_publish_after
+
+        # Everything the summary needs in two queries, ordered like the old active() / inactive()
+        participants = list(standup.participants.filter(read_only=False).select_related('user').prefetch_related(
+            models.Prefetch('answers', queryset=StandupParticipationAnswer.objects.select_related('question').order_by('question__order'))
+        ).order_by('user__first_name'))
+        active = [p for p in participants if p.completed]
+        inactive = [p for p in participants if not p.completed]
         
-        if timezone.now() < notify_date and standup.participants.inactive().exists():
-            return
+        # Once published the summary is kept up to date, no need to wait anymore
+        if timezone.now() < notify_date and inactive and not standup.pinned_message_id and not standup.summary_messages.exists():
+            return None
+
+        # Don't send if the standup had no participant
+        if not active:
+            return None
 
         msg = '** %s **\n** %s **\n' % (standup.event.standup_type.name, standup.standup_date.strftime('%A %b %d, %Y'))
         if not standup.event.standup_type.private:
             msg = '%s\n%s' % (msg, standup.get_public_url())
 
         channel_id = int(standup.event.channel.discord_channel_id)
-        channel = bot.get_channel(channel_id)
-
-        participants = standup.participants.active()
-        
-        # Don't send if the standup had no participant
-        if not participants.exists():
-            return
 
-        msg_obj = await channel.send(msg)
+        blocks = [msg]
 
-        for parti in participants:
-            if not parti.answers.exists():
+        for parti in active:
+            answers = parti.answers.all()
+            if not answers:
                 continue
 
             content = []
-            for ans in parti.answers.all().order_by('question__order'):
+            for ans in answers:
                 if not ans.answer:
                     continue
                     
@@ -288,25 +540,152 @@ class Standup(models.Model):
             if len(content) > 1900:
                 content = '%s...' % content[0:1900]
 
-            msg = '<@%s>:\n```md\n%s```' % (parti.user.discord_id, content)
-            
-            await channel.send(msg)
+            blocks.append('<@%s>:\n```md\n%s```' % (parti.user.discord_id, content))
         
-        if standup.participants.inactive().exists():
-            inactive = ', '.join(['<@%s>' % x.user.discord_id for x in standup.participants.inactive()])
-            msg = 'Not filled in (yet) by: %s' % (inactive,)
-            await channel.send(msg)
-
-        await msg_obj.pin()
-        standup.pinned_message_id = msg_obj.id
-        standup.rebuild_message = False
-        standup.save()
-
-    def previous_standup(self):
-        return Standup.objects.filter(id__lt=self.id, event=self.event).order_by('-id').first()
-    
-    def next_standup(self):
-        return Standup.objects.filter(id__gt=self.id, event=self.event).order_by('id').first()
+        if inactive:
+            blocks.append('Not filled in (yet) by: %s' % ', '.join(['<@%s>' % x.user.discord_id for x in inactive]))
+
+        messages = pack_messages(blocks)
+
+        return (channel_id, messages)
+
+    def get_summary_messages(self):
+        return dict([(m.position, m) for m in self.summary_messages.all()])
+
+    def mark_published(self, published, pinned_message_id=None, complete=True, lease=None):
+        '''
+        Remembers the (position, message ID, content) of every summary message
+        so later changes can be edited in place, and the pinned message once
+        the pin worked. Unless `complete` the summary stays marked for a
+        rebuild, some of its messages or the pin didn't make it. With a
+        `Lease` nothing is written unless it's still held.
+        '''
+        with transaction.atomic():
+            if lease:
+                lease.fence()
+
+            # Markers added while this summary was built stay for the next round
+            if complete:
+                StandupSummaryRebuild.objects.filter(standup=self, id__lte=getattr(self, 'rebuild_until', None) or 0).delete()
+            elif not StandupSummaryRebuild.objects.filter(standup=self).exists():
+                # Sent by hand (!sendsummary), the bot retries it from here on
+                StandupSummaryRebuild.objects.mark(self.pk)
+
+            if pinned_message_id and pinned_message_id != self.pinned_message_id:
+                self.pinned_message_id = pinned_message_id
+                self.save(update_fields=['pinned_message_id'])
+
+            if published:
+                self.summary_messages.all().delete()
+                StandupSummaryMessage.objects.bulk_create([
+                    StandupSummaryMessage(standup=self, position=position, discord_message_id=message_id, content=content) 
+                    for position, message_id, content in published])
+
+    async def send_summary(self, bot, db, dispatcher, lease=None):
+        '''
+        Sends and pins the summary, or if it was published before only edits
+        the messages that changed. All database work goes through the given
+        `DatabaseExecutor` so the event loop is never blocked by it and all
+        messages go through the `MessageDispatcher`. Returns False if there's
+        nothing to send yet or some messages failed, the summary has to be
+        tried again later. Messages deleted by hand are sent again, the first
+        message is pinned until that worked. With a `Lease` the token is
+        checked before every round of Discord calls and the write, raising
+        `LeaseLost` once another replica took over.
+        '''
+        summary = await db.run(self.build_summary)
+
+        if not summary:
+            return False
+
+        channel_id, messages = summary
+        previous = await db.run(self.get_summary_messages)
+
+        # Published before the messages were remembered, there's nothing to edit
+        if self.pinned_message_id and not previous:
+            await db.run(self.mark_published, [], lease=lease)
+            return True
+
+        channel = bot.get_channel(channel_id)
+
+        if lease:
+            await db.run(lease.fence)
+
+        # Same route, so these are still done in order. Positions that failed
+        # to send before are missing from `previous` and sent now.
+        edits = [p for p in range(len(messages)) if p in previous and previous[p].content != messages[p]]
+        sends = [p for p in range(len(messages)) if p not in previous]
+        stale = [previous[p] for p in sorted(previous) if p >= len(messages)]
+
+        results = await asyncio.gather(*(
+            [dispatcher.edit(bot.http, channel_id, previous[p].discord_message_id, messages[p]) for p in edits] +
+            [dispatcher.send(channel, messages[p]) for p in sends] +
+            [dispatcher.delete(bot.http, channel_id, old.discord_message_id) for old in stale]), return_exceptions=True)
+
+        edited = dict(zip(edits, results[:len(edits)]))
+        sent = dict(zip(sends, results[len(edits):len(edits) + len(sends)]))
+        deleted = results[len(edits) + len(sends):]
+
+        # Messages deleted by hand can't be edited anymore, they're sent again
+        gone = [p for p in edits if _not_found(edited[p])]
+        if gone:
+            if lease:
+                await db.run(lease.fence)
+            sent.update(zip(gone, await asyncio.gather(*[dispatcher.send(channel, messages[p]) for p in gone], return_exceptions=True)))
+
+        # Everything that made it is remembered, the rest is retried with the marker
+        failed = []
+        published = []
+        for position, content in enumerate(messages):
+            if position in sent:
+                if isinstance(sent[position], Exception):
+                    failed.append(sent[position])
+                else:
+                    published.append((position, str(sent[position].id), content))
+            elif isinstance(edited.get(position), Exception):
+                failed.append(edited[position])
+                published.append((position, previous[position].discord_message_id, previous[position].content))
+            else:
+                published.append((position, previous[position].discord_message_id, content))
+
+        for old, result in zip(stale, deleted):
+            if isinstance(result, Exception) and not _not_found(result):
+                failed.append(result)
+                published.append((old.position, old.discord_message_id, old.content))
+
+        # The first message is pinned once it's there, a failed pin is retried
+        pinned_message_id = None
+        first = published[0] if published and published[0][0] == 0 else None
+        if first and first[1] != self.pinned_message_id:
+            if lease:
+                await db.run(lease.fence)
+            try:
+                await dispatcher.pin(bot.http, channel_id, first[1])
+                pinned_message_id = first[1]
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                failed.append(e)
+
+        for e in failed:
+            print('Could not publish the summary of %s: %r' % (self, e))
+
+        await db.run(self.mark_published, published, pinned_message_id, not failed, lease)
+        return not failed
+
+    def neighbours(self):
+        '''
+        Returns the previous and next standup of the event (or None) in one
+        query, sharing this standup's event so their URLs need no queries.
+        '''
+        previous, following = find_neighbours(self, Standup.objects.filter(event=self.event_id))
+
+        if Standup.event.is_cached(self):
+            for neighbour in (previous, following):
+                if neighbour:
+                    neighbour.event = self.event
+
+        return (previous, following)
     
     def get_public_url(self):
         current_site = Site.objects.get_current().domain
@@ -322,6 +701,67 @@ class Standup(models.Model):
         return '%s -> %s' % (self.event, self.standup_date)
 
 
+class StandupSummaryMessage(models.Model):
+    standup = models.ForeignKey('Standup', on_delete=models.CASCADE, related_name='summary_messages')
+    position = models.PositiveIntegerField()
+    discord_message_id = models.CharField(max_length=255)
+    content = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = (('standup', 'position'),)
+
+
+class StandupSummaryRebuildManager(models.Manager):
+
+    def mark(self, standup_id):
+        '''
+        Marks the summary of the standup as out of date. Only ever inserts, so
+        concurrent submits for the same standup don't wait on each other.
+        '''
+        self.create(standup_id=standup_id)
+
+    def pending_standups(self, shard=None):
+        '''
+        Returns the standups with an out of date summary that are published to
+        their channel, each with `rebuild_until` set to its newest marker.
+        Markers of standups that are never published are dropped. With a
+        `Shard` only the standups of the shard's guilds are looked at.
+        '''
+        markers = self.all()
+        if shard:
+            markers = shard.filter(markers, 'standup__event__channel__server')
+
+        pending = dict(markers.values_list('standup_id').annotate(models.Max('id')).order_by())
+        if not pending:
+            return []
+
+        standups = list(Standup.objects.filter(
+            id__in=pending.keys(),
+            event__standup_type__publish_to_channel=True
+        ).select_related('event__channel__server', 'event__standup_type'))
+
+        for standup in standups:
+            standup.rebuild_until = pending.pop(standup.pk)
+
+        if pending:
+            self.filter(standup__in=pending.keys(), id__lte=max(pending.values())).delete()
+
+        return standups
+
+
+class StandupSummaryRebuild(models.Model):
+    '''
+    Append-only set of standups whose channel summary has to be rebuilt, the
+    bot drains it. A standup can be in here many times, that's coalesced into
+    one rebuild.
+    '''
+    standup = models.ForeignKey('Standup', on_delete=models.CASCADE, related_name='summary_rebuilds')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = StandupSummaryRebuildManager()
+
+
 class StandupParticipationManager(models.Manager):
     
     def active(self):
@@ -335,18 +775,25 @@ class StandupParticipation(models.Model):
     standup = models.ForeignKey('Standup', on_delete=models.PROTECT, related_name='participants')
     user = models.ForeignKey('User', on_delete=models.PROTECT, related_name='participations')
     read_only = models.BooleanField(default=False)
-    single_use_token = models.CharField(max_length=255, blank=True, null=True)
+    single_use_token = models.CharField(max_length=255, blank=True, null=True, unique=True)
     completed = models.BooleanField(default=False)
     notified = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     objects = StandupParticipationManager()
 
-    def previous_participation(self):
-        return StandupParticipation.objects.filter(id__lt=self.id, standup__event=self.standup.event, user=self.user).order_by('-id').first()
-    
-    def next_participation(self):
-        return StandupParticipation.objects.filter(id__gt=self.id, standup__event=self.standup.event, user=self.user).order_by('id').first()
+    class Meta:
+        indexes = [
+            models.Index(fields=['standup', 'completed', 'read_only'], name='participation_state_idx'),
+            models.Index(fields=['user', 'created_at', 'id'], name='participation_user_idx'),
+        ]
+
+    def neighbours(self):
+        '''
+        Returns the previous and next participation of the user in the same
+        event (or None) with their standups, in one query.
+        '''
+        return find_neighbours(self, StandupParticipation.objects.filter(standup__event=self.standup.event_id, user=self.user_id).select_related('standup'))
 
     def get_form_url(self):
         current_site = Site.objects.get_current().domain
@@ -364,12 +811,10 @@ class StandupParticipation(models.Model):
         if not self.single_use_token:
             self.single_use_token = get_random_string(length=48)
 
-        if self.completed:
-            su = self.standup
-            su.rebuild_message = True
-            su.save()
-
         super(StandupParticipation, self).save(*args, **kwargs)
+
+        if self.completed:
+            StandupSummaryRebuild.objects.mark(self.standup_id)
     
     def __str__(self):
         return '%s -> %s#%s' % (self.standup, self.user.first_name, self.user.last_name)
@@ -383,3 +828,86 @@ class StandupParticipationAnswer(models.Model):
     class Meta:
         unique_together = (('participation', 'question'),)
 
+
+class ChannelListingManager(models.Manager):
+
+    def record_standups(self, standups):
+        '''
+        Lists the channels of the given (new) standups, skips the ones that are already listed.
+        '''
+        event_ids = set([s.event_id for s in standups])
+        if not event_ids:
+            return
+
+        listed = set()
+        for ids in in_batches(event_ids):
+            listed.update(StandupEvent.objects.using(self.db).filter(id__in=ids).values_list('channel_id', 'standup_type_id'))
+
+        self.bulk_create([
+            PublicChannelListing(channel_id=channel_id, standup_type_id=standup_type_id)
+            for channel_id, standup_type_id in listed
+        ], ignore_conflicts=True)
+
+    def record_participations(self, participations):
+        '''
+        Lists the channels of the given (new) participations for their users.
+        '''
+        users = {}
+        for p in participations:
+            users.setdefault(p.standup_id, set()).add(p.user_id)
+
+        if not users:
+            return
+
+        channels = []
+        for ids in in_batches(users.keys()):
+            channels.extend(Standup.objects.using(self.db).filter(id__in=ids).values_list('id', 'event__channel_id'))
+
+        self.bulk_create([
+            UserChannelListing(user_id=user_id, channel_id=channel_id)
+            for standup_id, channel_id in channels
+            for user_id in users[standup_id]
+        ], ignore_conflicts=True)
+
+
+class PublicChannelListing(models.Model):
+    '''
+    Every channel that ever had a standup of a type, maintained as standups
+    are created so the sidebar doesn't need to scan the whole history.
+    '''
+    channel = models.ForeignKey('Channel', on_delete=models.CASCADE, related_name='public_listings')
+    standup_type = models.ForeignKey('StandupType', on_delete=models.CASCADE, related_name='channel_listings')
+
+    objects = ChannelListingManager()
+
+    class Meta:
+        unique_together = (('channel', 'standup_type'),)
+
+
+class UserChannelListing(models.Model):
+    '''
+    Every channel a user ever participated in, for the private overview.
+    '''
+    user = models.ForeignKey('User', on_delete=models.CASCADE, related_name='channel_listings')
+    channel = models.ForeignKey('Channel', on_delete=models.CASCADE, related_name='user_listings')
+
+    objects = ChannelListingManager()
+
+    class Meta:
+        unique_together = (('user', 'channel'),)
+
+
+class BotLease(models.Model):
+    '''
+    Lease on the periodic work of a bot shard, only the process holding it
+    sends notifications and summaries. The token goes up every time the lease
+    changes hands and fences off the writes of a previous holder.
+    '''
+    name = models.CharField(max_length=100, unique=True)
+    holder = models.CharField(max_length=255, blank=True)
+    token = models.BigIntegerField(default=0)
+    expires_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return '%s (%s #%d)' % (self.name, self.holder or 'free', self.token)
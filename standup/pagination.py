@@ -0,0 +1,90 @@
+import base64
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class KeysetPaginationMixin(object):
+    '''
+    Cursor based pagination for list views ordered newest first on
+    (created_at, id). Pages are fetched with a `WHERE (created_at, id) < cursor`
+    filter instead of an OFFSET, so every page is as fast as the first one.
+    `?after=` walks to older rows, `?before=` back to newer ones.
+    '''
+    page_size = 50
+    total_limit = 1000
+
+    def get_page_queryset(self, queryset):
+        '''
+        Hook to add select_related / annotations to the rows of a single page.
+        '''
+        return queryset
+
+    def encode_cursor(self, obj):
+        raw = '%s|%s' % (obj.created_at.isoformat(), obj.pk)
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, value):
+        try:
+            created_at, pk = base64.urlsafe_b64decode(value.encode('ascii')).decode('utf-8').split('|')
+            created_at = parse_datetime(created_at)
+            pk = int(pk)
+        except (ValueError, UnicodeError):
+            return None
+
+        if not created_at:
+            return None
+        return (created_at, pk)
+
+    def get_page_url(self, direction, obj):
+        params = self.request.GET.copy()
+        params.pop('after', None)
+        params.pop('before', None)
+        params[direction] = self.encode_cursor(obj)
+        return '?%s' % params.urlencode()
+
+    def get_approximate_total(self, queryset):
+        '''
+        Counts up to `total_limit` rows, returns the count and if there are more.
+        '''
+        total = queryset[:self.total_limit + 1].count()
+        return (min(total, self.total_limit), total > self.total_limit)
+
+    def paginate_keyset(self, queryset):
+        after = self.decode_cursor(self.request.GET.get('after', ''))
+        before = self.decode_cursor(self.request.GET.get('before', ''))
+
+        if before:
+            created_at, pk = before
+            qs = queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)).order_by('created_at', 'id')
+            rows = list(self.get_page_queryset(qs)[:self.page_size + 1])
+            has_previous = len(rows) > self.page_size
+            rows = list(reversed(rows[:self.page_size]))
+            has_next = True
+        else:
+            qs = queryset
+            if after:
+                created_at, pk = after
+                qs = qs.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+            qs = qs.order_by('-created_at', '-id')
+            rows = list(self.get_page_queryset(qs)[:self.page_size + 1])
+            has_next = len(rows) > self.page_size
+            rows = rows[:self.page_size]
+            has_previous = bool(after)
+
+        return {
+            'object_list': rows,
+            'previous_url': self.get_page_url('before', rows[0]) if rows and has_previous else None,
+            'next_url': self.get_page_url('after', rows[-1]) if rows and has_next else None,
+        }
+
+    def get_context_data(self, **kwargs):
+        queryset = kwargs.pop('object_list', self.object_list)
+        page = self.paginate_keyset(queryset)
+
+        if self.request.GET.get('total'):
+            page['total'], page['total_more'] = self.get_approximate_total(queryset)
+
+        context = super(KeysetPaginationMixin, self).get_context_data(object_list=page['object_list'], **kwargs)
+        context['page'] = page
+        return context
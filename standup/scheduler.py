@@ -0,0 +1,287 @@
+import asyncio
+import datetime
+import heapq
+import threading
+
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
+from django.utils import timezone
+
+from standup import models
+
+
+def next_fire_time(standup_type, tz, mute_until=None, after_date=None, now=None):
+    '''
+    Calculates the next moment a standup of the given type should be initiated
+    for someone living in the given timezone. Days on or before `after_date`
+    (the last local date we fired for) and `mute_until` are skipped. If today
+    is a standup day and the start time already passed the returned moment is
+    in the past, meaning it's due right away. Returns None if the standup type
+    is not enabled on any weekday.
+    '''
+    if not now:
+        now = timezone.now()
+
+    day = timezone.localtime(now, timezone=tz).date()
+
+    if after_date and after_date >= day:
+        day = after_date + datetime.timedelta(days=1)
+
+    if mute_until and mute_until >= day:
+        day = mute_until + datetime.timedelta(days=1)
+
+    for offset in range(7):
+        candidate = day + datetime.timedelta(days=offset)
+        if not standup_type.in_timeslot(candidate):
+            continue
+
+        # initiate() only notifies once the local time is past the start time
+        start = datetime.datetime.combine(candidate, standup_type.create_new_event_at)
+        start += datetime.timedelta(seconds=1)
+        return tz.normalize(tz.localize(start))
+
+    return None
+
+
+class StandupScheduler(object):
+    '''
+    Keeps the next fire time of every active attendee in a heap, so the bot
+    only has to wake up when something is actually due. Changes to users,
+    standup types, events and attendees made in this process are picked up
+    through model signals and only the affected entries are recalculated,
+    changes made elsewhere (like the admin) are picked up by a periodic resync.
+    With a `Shard` only the attendees of the shard's guilds are scheduled.
+    '''
+
+    MODELS = ((models.User, 'users'), (models.StandupType, 'types'),
+              (models.StandupEvent, 'events'), (models.Attendee, 'attendees'))
+
+    def __init__(self, resync_interval=900, shard=None):
+        self.resync_interval = resync_interval
+        self.shard = shard
+        self._heap = []
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._dirty = {'users': set(), 'types': set(), 'events': set(), 'attendees': set()}
+        self._last_sync = None
+        self._loop = None
+        self._wakeup = None
+
+    def connect(self, loop=None):
+        '''
+        Registers the signal handlers and binds the scheduler to an event loop
+        so changes can wake up a sleeping `wait()`.
+        '''
+        self._loop = loop or asyncio.get_event_loop()
+        self._wakeup = asyncio.Event(loop=self._loop)
+
+        for model, kind in self.MODELS:
+            receiver = self._receiver(kind)
+            uid = 'standup_scheduler_%s' % kind
+            post_save.connect(receiver, sender=model, weak=False, dispatch_uid='%s_save' % uid)
+            post_delete.connect(receiver, sender=model, weak=False, dispatch_uid='%s_delete' % uid)
+
+    def disconnect(self):
+        '''
+        Removes the signal handlers registered by `connect()`.
+        '''
+        for model, kind in self.MODELS:
+            uid = 'standup_scheduler_%s' % kind
+            post_save.disconnect(sender=model, dispatch_uid='%s_save' % uid)
+            post_delete.disconnect(sender=model, dispatch_uid='%s_delete' % uid)
+
+    def _receiver(self, kind):
+        def receiver(sender, instance, **kwargs):
+            self.mark(kind, instance.pk)
+        return receiver
+
+    def mark(self, kind, pk):
+        '''
+        Marks a user, type, event or attendee as changed, its entries will be
+        recalculated on the next `refresh()`.
+        '''
+        with self._lock:
+            self._dirty[kind].add(pk)
+        self.wake()
+
+    def wake(self):
+        if self._loop and self._wakeup:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _attendees(self):
+        qs = models.Attendee.objects.select_related('user', 'standup__standup_type')
+        if self.shard:
+            qs = self.shard.filter(qs, 'standup__channel__server')
+        return qs
+
+    def _schedule(self, att, after_date=None, now=None):
+        fire_at = next_fire_time(
+            att.standup.standup_type,
+            att.user.timezone,
+            mute_until=att.user.mute_until,
+            after_date=after_date,
+            now=now)
+
+        if not fire_at:
+            self._entries.pop(att.pk, None)
+            return
+
+        self._entries[att.pk] = (fire_at, att)
+        heapq.heappush(self._heap, (fire_at, att.pk))
+
+    def _notified_today(self, attendees, now):
+        '''
+        Returns the (event, user, date) of the attendees that were already
+        notified today, in their own timezone, with a query per
+        `IN_BATCH_SIZE` events.
+        '''
+        # Every timezone's today is within a day of UTC's
+        participations = models.StandupParticipation.objects.filter(
+            notified=True,
+            standup__standup_date__gte=(now - datetime.timedelta(days=1)).date(),
+            standup__standup_date__lte=(now + datetime.timedelta(days=1)).date())
+
+        notified = set()
+        for ids in models.in_batches(set([att.standup_id for att in attendees])):
+            notified.update(participations.filter(standup__event__in=ids).values_list('standup__event_id', 'user_id', 'standup__standup_date'))
+        return notified
+
+    def _reschedule(self, attendees, now):
+        # Attendees already notified today wait for their next standup day,
+        # so a resync doesn't make everyone of today due again
+        notified = self._notified_today(attendees, now)
+        scheduled = []
+
+        for att in attendees:
+            today = timezone.localtime(now, timezone=att.user.timezone).date()
+            scheduled.append((att, today if (att.standup_id, att.user_id, today) in notified else None))
+
+        return scheduled
+
+    def rebuild(self, now=None):
+        '''
+        Recalculates every entry from scratch.
+        '''
+        if not now:
+            now = timezone.now()
+
+        # Changes marked from here on may not be in the query, they stay dirty
+        with self._lock:
+            for kind in self._dirty:
+                self._dirty[kind] = set()
+
+        scheduled = self._reschedule(list(self._attendees().filter(active=True)), now)
+
+        with self._lock:
+            self._heap = []
+            self._entries = {}
+            for att, after_date in scheduled:
+                self._schedule(att, after_date=after_date, now=now)
+            self._last_sync = timezone.now()
+
+    def refresh(self, now=None):
+        '''
+        Recalculates the entries affected by changes since the last refresh,
+        or everything if the resync interval has passed.
+        '''
+        if not self._last_sync or (timezone.now() - self._last_sync).total_seconds() > self.resync_interval:
+            return self.rebuild(now=now)
+
+        if not now:
+            now = timezone.now()
+
+        with self._lock:
+            dirty = self._dirty
+            self._dirty = {'users': set(), 'types': set(), 'events': set(), 'attendees': set()}
+
+        if not any(dirty.values()):
+            return
+
+        attendees = list(self._attendees().filter(
+            Q(pk__in=dirty['attendees']) |
+            Q(user__in=dirty['users']) |
+            Q(standup__in=dirty['events']) |
+            Q(standup__standup_type__in=dirty['types'])))
+
+        scheduled = self._reschedule([att for att in attendees if att.active], now)
+
+        with self._lock:
+            # Deleted attendees don't show up in the query anymore
+            for pk in dirty['attendees']:
+                self._entries.pop(pk, None)
+
+            for att in attendees:
+                if not att.active:
+                    self._entries.pop(att.pk, None)
+
+            for att, after_date in scheduled:
+                self._schedule(att, after_date=after_date, now=now)
+
+    def next_due(self):
+        '''
+        Returns the earliest fire time, or None if nothing is scheduled.
+        '''
+        with self._lock:
+            while self._heap:
+                fire_at, pk = self._heap[0]
+                entry = self._entries.get(pk)
+                if entry and entry[0] == fire_at:
+                    return fire_at
+                # Outdated heap item, the entry was removed or rescheduled
+                heapq.heappop(self._heap)
+        return None
+
+    def pop_due(self, now=None):
+        '''
+        Returns the attendees that are due and schedules their next occurrence.
+        '''
+        if not now:
+            now = timezone.now()
+
+        due = []
+
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                fire_at, pk = heapq.heappop(self._heap)
+                entry = self._entries.get(pk)
+                if not entry or entry[0] != fire_at:
+                    continue
+
+                att = entry[1]
+                due.append(att)
+                fired_on = timezone.localtime(fire_at, timezone=att.user.timezone).date()
+                self._schedule(att, after_date=fired_on, now=now)
+
+        return due
+
+    def retry(self, attendees, delay, now=None):
+        '''
+        Puts attendees returned by `pop_due()` back in the schedule, due again
+        after `delay` seconds. For when initiating them failed, otherwise they
+        would only come up again on their next standup day.
+        '''
+        if not now:
+            now = timezone.now()
+
+        fire_at = now + datetime.timedelta(seconds=delay)
+
+        with self._lock:
+            for att in attendees:
+                self._entries[att.pk] = (fire_at, att)
+                heapq.heappush(self._heap, (fire_at, att.pk))
+
+    async def wait(self, timeout):
+        '''
+        Sleeps until the next entry is due, something changed or the timeout
+        passed, whichever comes first.
+        '''
+        fire_at = self.next_due()
+        if fire_at:
+            timeout = min(timeout, max((fire_at - timezone.now()).total_seconds(), 0))
+
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+        self._wakeup.clear()
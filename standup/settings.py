@@ -53,6 +53,7 @@ RECAPTCHA_PRIVATE_KEY = os.getenv('RECAPTCHA_PRIVATE')
 SITE_ID = 1
 
 MIDDLEWARE = [
+    'standup.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -146,3 +147,75 @@ AUTH_USER_MODEL = 'standup.User'
 
 SECRET_KEY = os.getenv('DISCORD_TOKEN')
 DISCORD_TOKEN = os.getenv('DISCORD_TOKEN')
+
+# Seconds between full rebuilds of the bot's standup schedule, picks up
+# changes made outside of the bot process (like the admin)
+SCHEDULER_RESYNC_INTERVAL = int(os.getenv('SCHEDULER_RESYNC_INTERVAL', 900))
+
+# Number of threads the bot uses for database work, keeps the ORM off the event loop
+BOT_DB_POOL_SIZE = int(os.getenv('BOT_DB_POOL_SIZE', 4))
+
+# Outbound Discord calls, number of concurrent workers and the global requests per second budget
+BOT_DISPATCH_WORKERS = int(os.getenv('BOT_DISPATCH_WORKERS', 8))
+BOT_DISPATCH_RATE = int(os.getenv('BOT_DISPATCH_RATE', 45))
+
+# Number of bot processes (Discord shards) and the shard of this process, every
+# shard only handles the standups of its own guilds. The web process uses the
+# count to notify every shard through the change feed.
+BOT_SHARD_COUNT = int(os.getenv('BOT_SHARD_COUNT', 1))
+BOT_SHARD_ID = int(os.getenv('BOT_SHARD_ID', 0))
+
+# Seconds a bot replica holds the lease of its shard without a heartbeat,
+# a standby replica takes over after this when the holder disappears
+BOT_LEASE_DURATION = int(os.getenv('BOT_LEASE_DURATION', 15))
+
+# Port of the bot's Prometheus metrics listener, 0 disables it. It only listens
+# on 127.0.0.1 unless the scrapers below are configured. The web app serves its
+# own metrics on /metrics/.
+BOT_METRICS_PORT = int(os.getenv('BOT_METRICS_PORT', 0))
+
+# Who may scrape the metrics: IP addresses as seen by Django (comma separated)
+# and/or a token sent as "Authorization: Bearer <token>". With neither the web
+# app's /metrics/ is a 404. Metrics are kept per process, behind a server with
+# multiple web workers every scrape only sees the worker that answered it, so
+# scrape a web process running a single worker for numbers that add up.
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.getenv('METRICS_ALLOWED_IPS', '').split(',') if ip.strip()]
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Base URL of the Discord API the bot talks to, empty uses Discord itself. Point
+# it at `run_fake_discord` (like http://127.0.0.1:8765/api/v7) for load tests.
+DISCORD_API_URL = os.getenv('DISCORD_API_URL', '')
+
+# Where the web process tells the bot about changes when not running on
+# PostgreSQL (which uses LISTEN/NOTIFY), shard N listens on the port + N.
+# A port of 0 disables it. The bot can't tell whether the web process reaches
+# it, so it still polls for summaries every minute while the feed is up.
+CHANGEFEED_HOST = os.getenv('CHANGEFEED_HOST', '127.0.0.1')
+CHANGEFEED_PORT = int(os.getenv('CHANGEFEED_PORT', 47311))
+
+# Number of Discord user, server and channel ID's the bot keeps mapped to database rows
+IDENTITY_CACHE_SIZE = int(os.getenv('IDENTITY_CACHE_SIZE', 10000))
+
+# Rendered pages of past public standups, invalidated when a participation or
+# answer changes. The local memory cache is per process and invalidation only
+# reaches the worker that handled the change, so its pages expire after a minute.
+# When running multiple web workers use
+# django.core.cache.backends.filebased.FileBasedCache with a directory as
+# PAGE_CACHE_LOCATION so they share it, pages are kept until invalidated then.
+PAGE_CACHE_BACKEND = os.getenv('PAGE_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+PAGE_CACHE_TIMEOUT = os.getenv('PAGE_CACHE_TIMEOUT', '60' if PAGE_CACHE_BACKEND.endswith('LocMemCache') else '')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'standup_pages': {
+        'BACKEND': PAGE_CACHE_BACKEND,
+        'LOCATION': os.getenv('PAGE_CACHE_LOCATION', 'standup-pages'),
+        'TIMEOUT': int(PAGE_CACHE_TIMEOUT) if PAGE_CACHE_TIMEOUT else None,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('PAGE_CACHE_MAX_ENTRIES', 1000)),
+            'CULL_FREQUENCY': 4,
+        },
+    },
+}
@@ -0,0 +1,47 @@
+from django.db.models import BigIntegerField, ExpressionWrapper, F
+from django.db.models.functions import Cast
+
+
+class Shard(object):
+    '''
+    The part of the guilds a bot process is responsible for. Discord assigns
+    a guild to shard `(guild_id >> 22) % shard_count`, the same mapping is used
+    to only schedule and publish the standups of the guilds this shard's
+    gateway connection receives. A single shard owns everything.
+    '''
+
+    def __init__(self, shard_id=0, shard_count=1):
+        if not 0 <= shard_id < shard_count:
+            raise ValueError('Shard ID %d is not in 0..%d' % (shard_id, shard_count - 1))
+
+        self.shard_id = shard_id
+        self.shard_count = shard_count
+
+    @property
+    def sharded(self):
+        return self.shard_count > 1
+
+    def for_guild(self, guild_id):
+        return (int(guild_id) >> 22) % self.shard_count
+
+    def owns_guild(self, guild_id):
+        return self.for_guild(guild_id) == self.shard_id
+
+    def filter(self, queryset, server_path):
+        '''
+        Limits the queryset to the rows of servers owned by this shard,
+        `server_path` is the lookup from the queryset's model to the Server
+        (like `event__channel__server`).
+        '''
+        if not self.sharded:
+            return queryset
+
+        # Shifting right is dividing by 2^22, both databases truncate integer division
+        guild_shard = ExpressionWrapper(
+            Cast(F('%s__discord_guild_id' % server_path), BigIntegerField()) / (1 << 22) % self.shard_count,
+            output_field=BigIntegerField())
+
+        return queryset.annotate(guild_shard=guild_shard).filter(guild_shard=self.shard_id)
+
+    def __str__(self):
+        return '%d/%d' % (self.shard_id, self.shard_count)
@@ -0,0 +1,75 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from standup import models
+from standup import changefeed
+from standup.cache import invalidate_standup_page, invalidate_all_pages
+
+
+@receiver(post_save, sender=models.StandupParticipation)
+@receiver(post_delete, sender=models.StandupParticipation)
+def participation_changed(sender, instance, **kwargs):
+    invalidate_standup_page(pk=instance.standup_id)
+
+
+@receiver(post_save, sender=models.StandupParticipationAnswer)
+@receiver(post_delete, sender=models.StandupParticipationAnswer)
+def answer_changed(sender, instance, **kwargs):
+    invalidate_standup_page(participants=instance.participation_id)
+
+
+@receiver(post_save, sender=models.Standup)
+def standup_saved(sender, instance, **kwargs):
+    invalidate_standup_page(pk=instance.pk)
+
+
+@receiver(post_save, sender=models.User)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    # The pages show the first name, logins and bot settings don't change it
+    if update_fields is not None and 'first_name' not in update_fields:
+        return
+    invalidate_standup_page(participants__user=instance.pk)
+
+
+@receiver(post_save, sender=models.StandupType)
+@receiver(post_save, sender=models.StandupQuestion)
+@receiver(post_save, sender=models.Channel)
+@receiver(post_save, sender=models.Server)
+def page_content_changed(sender, **kwargs):
+    # Rare admin changes that can show up on any page
+    invalidate_all_pages()
+
+
+@receiver(post_save, sender=models.Standup)
+def standup_created(sender, instance, created, **kwargs):
+    if created:
+        models.PublicChannelListing.objects.record_standups([instance])
+
+
+@receiver(post_save, sender=models.StandupParticipation)
+def participation_created(sender, instance, created, **kwargs):
+    if created:
+        models.UserChannelListing.objects.record_participations([instance])
+
+
+@receiver(post_save, sender=models.StandupSummaryRebuild)
+def summary_rebuild_marked(sender, instance, created, **kwargs):
+    if created:
+        changefeed.publish('summary', instance.standup_id)
+
+
+def _publish_schedule_change(kind, fields=None):
+    def receiver(sender, instance, update_fields=None, **kwargs):
+        # Like logins, saves that can't change the schedule aren't published
+        if fields and update_fields is not None and not fields.intersection(update_fields):
+            return
+        changefeed.publish(kind, instance.pk)
+    return receiver
+
+
+for _model, _kind, _fields in ((models.User, 'users', {'timezone', 'mute_until'}),
+                               (models.StandupType, 'types', None),
+                               (models.StandupEvent, 'events', None),
+                               (models.Attendee, 'attendees', None)):
+    post_save.connect(_publish_schedule_change(_kind, _fields), sender=_model, weak=False, dispatch_uid='changefeed_%s_save' % _kind)
+    post_delete.connect(_publish_schedule_change(_kind), sender=_model, weak=False, dispatch_uid='changefeed_%s_delete' % _kind)
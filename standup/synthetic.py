@@ -0,0 +1,127 @@
+import datetime
+import random
+
+import pytz
+from django.db import transaction
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from standup import models
+
+
+class Rollback(Exception):
+    '''
+    Raised to roll back a transaction with synthetic data on purpose.
+    '''
+
+
+def generate(servers=2, channels=5, types=2, questions=4, users=50, days=30, seed=None, using='default'):
+    '''
+    Fills the database with a synthetic set of servers, channels (per server),
+    standup types with questions and users spread over all common timezones,
+    attending the standups with `days` days of history. Everything is created
+    with bulk inserts and gets a random prefix, so it can be run against a
+    database that already has data. Returns a dict with the created counts.
+    '''
+    rnd = random.Random(seed)
+    prefix = 'synthetic-%s' % get_random_string(8, allowed_chars='abcdefghijklmnopqrstuvwxyz0123456789')
+    base_id = rnd.randint(10 ** 15, 10 ** 16)
+    today = timezone.now().date()
+
+    with transaction.atomic(using=using):
+        models.Server.objects.db_manager(using).bulk_create([
+            models.Server(name='%s-server-%d' % (prefix, i), slug='%s-server-%d' % (prefix, i), discord_guild_id=str(base_id + i))
+            for i in range(servers)])
+        server_list = list(models.Server.objects.using(using).filter(slug__startswith=prefix).order_by('id'))
+
+        models.Channel.objects.db_manager(using).bulk_create([
+            models.Channel(name='channel-%d' % i, slug='channel-%d' % i, server=server, discord_channel_id=str(base_id + 1000 + server.pk * channels + i))
+            for server in server_list for i in range(channels)])
+        channel_list = list(models.Channel.objects.using(using).filter(server__in=server_list).order_by('id'))
+
+        models.StandupType.objects.db_manager(using).bulk_create([
+            models.StandupType(
+                name='Synthetic %d' % i,
+                command_name='%s-%d' % (prefix, i),
+                create_new_event_at=datetime.time(rnd.randint(0, 11)),
+                private=bool(i % 2),
+                publish_to_channel=True)
+            for i in range(types)])
+        type_list = list(models.StandupType.objects.using(using).filter(command_name__startswith=prefix).order_by('id'))
+
+        models.StandupQuestion.objects.db_manager(using).bulk_create([
+            models.StandupQuestion(standup_type=stype, question='Question %d?' % i, order=i, important=(i == questions - 1))
+            for stype in type_list for i in range(questions)])
+        question_map = {}
+        for question in models.StandupQuestion.objects.using(using).filter(standup_type__in=type_list).order_by('order'):
+            question_map.setdefault(question.standup_type_id, []).append(question)
+
+        timezones = pytz.common_timezones
+        models.User.objects.db_manager(using).bulk_create([
+            models.User(
+                username='%s-user-%d' % (prefix, i),
+                first_name='User %d' % i,
+                last_name='%04d' % (i % 10000),
+                discord_id=str(base_id + 10 ** 6 + i),
+                timezone=timezones[(i * 7) % len(timezones)])
+            for i in range(users)])
+        user_list = list(models.User.objects.using(using).filter(username__startswith=prefix).order_by('id'))
+
+        models.StandupEvent.objects.db_manager(using).bulk_create([
+            models.StandupEvent(channel=channel, standup_type=type_list[i % len(type_list)], created_by=user_list[0])
+            for i, channel in enumerate(channel_list)])
+        event_list = list(models.StandupEvent.objects.using(using).filter(channel__in=channel_list).select_related('standup_type').order_by('id'))
+
+        # Every user attends one or two standups
+        attending = dict([(event.pk, set()) for event in event_list])
+        for i, user in enumerate(user_list):
+            attending[event_list[i % len(event_list)].pk].add(user.pk)
+            if rnd.random() < 0.5:
+                attending[rnd.choice(event_list).pk].add(user.pk)
+
+        models.Attendee.objects.db_manager(using).bulk_create([
+            models.Attendee(standup_id=event_id, user_id=user_id, created_by=user_list[0], read_only=(rnd.random() < 0.05))
+            for event_id, user_ids in attending.items() for user_id in user_ids])
+
+        models.Standup.objects.db_manager(using).bulk_create([
+            models.Standup(event=event, standup_date=today - datetime.timedelta(days=day), pinned_message_id=str(base_id + day))
+            for event in event_list for day in range(days, 0, -1)])
+        standup_list = list(models.Standup.objects.using(using).filter(event__in=event_list).order_by('id'))
+        models.PublicChannelListing.objects.db_manager(using).record_standups(standup_list)
+
+        participations = []
+        for standup in standup_list:
+            for user_id in attending[standup.event_id]:
+                participations.append(models.StandupParticipation(
+                    standup=standup,
+                    user_id=user_id,
+                    single_use_token=get_random_string(length=48),
+                    completed=(rnd.random() < 0.8),
+                    notified=True))
+        models.StandupParticipation.objects.db_manager(using).bulk_create(participations, batch_size=500)
+        models.UserChannelListing.objects.db_manager(using).record_participations(participations)
+
+        events = dict([(event.pk, event) for event in event_list])
+        answers = []
+        for p in models.StandupParticipation.objects.using(using).filter(standup__in=standup_list, completed=True).select_related('standup').iterator():
+            for question in question_map[events[p.standup.event_id].standup_type_id]:
+                answers.append(models.StandupParticipationAnswer(
+                    participation=p,
+                    question=question,
+                    answer=' '.join(['lorem'] * rnd.randint(0, 40))))
+        models.StandupParticipationAnswer.objects.db_manager(using).bulk_create(answers, batch_size=500)
+
+        # Yesterday's summaries are still waiting to be published
+        models.StandupSummaryRebuild.objects.db_manager(using).bulk_create([
+            models.StandupSummaryRebuild(standup=standup) for standup in standup_list if standup.standup_date == today - datetime.timedelta(days=1)])
+
+    return {
+        'prefix': prefix,
+        'servers': len(server_list),
+        'channels': len(channel_list),
+        'standup_types': len(type_list),
+        'users': len(user_list),
+        'standups': len(standup_list),
+        'participations': len(participations),
+        'answers': len(answers),
+    }
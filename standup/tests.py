@@ -0,0 +1,1098 @@
+import asyncio
+import datetime
+import random
+import itertools
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+import aiohttp
+import discord
+from django.contrib.sites.models import Site
+from django.db import IntegrityError, transaction
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from standup import changefeed
+from standup import metrics
+from standup.forms import StandupForm
+from standup import models
+from standup.dispatcher import MessageDispatcher, MissingTarget
+from standup.executor import DatabaseExecutor
+from standup.identity import IdentityCache, identities
+from standup.lease import Lease, LeaseLost
+from standup.scheduler import StandupScheduler
+from standup.sharding import Shard
+
+
+class QueryCountTests(TestCase):
+    '''
+    The standup pages and listings take the same number of queries no matter
+    how many participants a standup has.
+    '''
+    SIZES = (3, 25)
+
+    @classmethod
+    def setUpTestData(cls):
+        # A public and a private standup type, with three days of standups
+        # for every size. The middle day is the one with neighbours.
+        discord_ids = itertools.count(1000)
+        today = timezone.now().date()
+        cls.middle = {}
+
+        for private in (False, True):
+            standup_type = models.StandupType.objects.create(name='Daily', command_name='daily-%s' % ('private' if private else 'public'), private=private)
+            questions = [models.StandupQuestion.objects.create(standup_type=standup_type, question='Question %d?' % i) for i in range(3)]
+
+            for size in cls.SIZES:
+                server = models.Server.objects.create(name='%s %d' % (standup_type.command_name, size), discord_guild_id=str(next(discord_ids)))
+                channel = models.Channel.objects.create(name='channel', server=server, discord_channel_id=str(next(discord_ids)))
+                users = [models.User.objects.create(username=str(next(discord_ids)), first_name='User %d' % i) for i in range(size)]
+                event = models.StandupEvent.objects.create(channel=channel, standup_type=standup_type, created_by=users[0])
+
+                for day in (3, 2, 1):
+                    standup = models.Standup.objects.create(event=event, standup_date=today - datetime.timedelta(days=day))
+                    participations = [
+                        models.StandupParticipation.objects.create(standup=standup, user=user, completed=(i % 3 != 0))
+                        for i, user in enumerate(users)]
+                    models.StandupParticipationAnswer.objects.bulk_create([
+                        models.StandupParticipationAnswer(participation=participation, question=question, answer='Answer')
+                        for participation in participations if participation.completed
+                        for question in questions])
+
+                    if day == 2:
+                        cls.middle[(private, size)] = participations[0]
+
+    def setUp(self):
+        # Otherwise only the first request pays for the site lookup
+        Site.objects.clear_cache()
+
+    def assertQueriesPerSize(self, num, url_for):
+        for size in self.SIZES:
+            with self.subTest(participants=size):
+                url = url_for(size)
+                Site.objects.clear_cache()
+
+                with self.assertNumQueries(num):
+                    response = self.client.get(url)
+
+                self.assertEqual(response.status_code, 200)
+
+    def test_public_standup(self):
+        def url_for(size):
+            standup = self.middle[(False, size)].standup
+            return reverse('public_standup', kwargs={
+                'server': standup.event.channel.server.slug,
+                'channel': standup.event.channel.slug,
+                'standup_type': standup.event.standup_type.command_name,
+                'date': str(standup.standup_date)})
+
+        # Standup, participants, answers, neighbours and the site for the links
+        self.assertQueriesPerSize(5, url_for)
+
+    def test_private_standup(self):
+        self.assertQueriesPerSize(5, lambda size: reverse('private_standup', args=[self.middle[(True, size)].single_use_token]))
+
+    def test_home(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('home'))
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_home_channel(self):
+        def url_for(size):
+            channel = self.middle[(False, size)].standup.event.channel
+            return '%s?server=%s&channel=%s' % (reverse('home'), channel.server.slug, channel.slug)
+
+        self.assertQueriesPerSize(4, url_for)
+
+    def test_private_home(self):
+        self.assertQueriesPerSize(4, lambda size: reverse('private_home', args=[self.middle[(True, size)].single_use_token]))
+
+
+class MetricsAccessTests(TestCase):
+    '''
+    The web app's metrics are off by default and only served to the
+    configured scrapers.
+    '''
+    def test_disabled_by_default(self):
+        with self.settings(METRICS_ALLOWED_IPS=[], METRICS_TOKEN=''):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+
+    def test_allowed_ip(self):
+        with self.settings(METRICS_ALLOWED_IPS=['10.0.0.1'], METRICS_TOKEN=''):
+            self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1').status_code, 200)
+            self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.2').status_code, 404)
+
+    def test_token(self):
+        with self.settings(METRICS_ALLOWED_IPS=[], METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+            self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 404)
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+
+    def test_web_families_only(self):
+        with self.settings(METRICS_ALLOWED_IPS=['127.0.0.1'], METRICS_TOKEN=''):
+            body = self.client.get(reverse('metrics')).content.decode('utf-8')
+            self.assertIn('standup_http_requests_total', body)
+            self.assertNotIn('standup_bot_', body)
+
+    def test_bot_listener_local_by_default(self):
+        with self.settings(METRICS_ALLOWED_IPS=[], METRICS_TOKEN=''):
+            self.assertEqual(metrics.MetricsServer(9100).host, '127.0.0.1')
+        with self.settings(METRICS_ALLOWED_IPS=[], METRICS_TOKEN='secret'):
+            self.assertEqual(metrics.MetricsServer(9100).host, '0.0.0.0')
+
+
+class ShardTests(TestCase):
+    '''
+    The SQL shard filter picks the same servers as `Shard.owns_guild`.
+    '''
+    GUILD_IDS = (
+        0, 1, (1 << 22) - 1, 1 << 22, 41771983423143937, 81384788765712384, 613425648685547541,
+        (1 << 62) + 12345, (1 << 63) - (1 << 22), (1 << 63) - 2, (1 << 63) - 1)
+
+    @classmethod
+    def setUpTestData(cls):
+        for guild_id in cls.GUILD_IDS:
+            server = models.Server.objects.create(name='Server %d' % guild_id, slug='server-%d' % guild_id, discord_guild_id=str(guild_id))
+            models.Channel.objects.create(name='channel', server=server, discord_channel_id=str(guild_id))
+
+    def test_sql_matches_python(self):
+        for shard_count in (2, 3, 7, 16):
+            for shard_id in range(shard_count):
+                shard = Shard(shard_id, shard_count)
+                with self.subTest(shard=str(shard)):
+                    self.assertEqual(
+                        set(shard.filter(models.Channel.objects.all(), 'server').values_list('server__discord_guild_id', flat=True)),
+                        set([str(guild_id) for guild_id in self.GUILD_IDS if shard.owns_guild(guild_id)]))
+
+
+class IdentityCacheTests(TestCase):
+    '''
+    The Discord ID cache of the bot.
+    '''
+    def discord_user(self, id):
+        return SimpleNamespace(id=id, display_name='User %d' % id, discriminator='0001')
+
+    def test_update_user_publishes(self):
+        cache = IdentityCache()
+        cache.user_id(self.discord_user(1))
+
+        with mock.patch('standup.changefeed.publish') as publish:
+            user = cache.update_user(self.discord_user(1), mute_until=datetime.date(2030, 1, 1))
+
+        # Other shards and replicas only hear about it through the change feed
+        publish.assert_called_once_with('users', user.pk)
+        self.assertEqual(models.User.objects.get(pk=user.pk).mute_until, datetime.date(2030, 1, 1))
+
+    def test_update_user_deleted_elsewhere(self):
+        cache = IdentityCache()
+        pk = cache.user_id(self.discord_user(1))
+        models.User.objects.filter(pk=pk).delete()
+
+        with mock.patch('standup.changefeed.publish') as publish:
+            user = cache.update_user(self.discord_user(1), timezone='Europe/Amsterdam')
+
+        self.assertNotEqual(user.pk, pk)
+        publish.assert_called_with('users', user.pk)
+        self.assertEqual(str(models.User.objects.get(discord_id='1').timezone), 'Europe/Amsterdam')
+
+
+    def test_lru(self):
+        cache = IdentityCache(maxsize=2)
+        cache.set('user', 1, 10)
+        cache.set('user', 2, 20)
+
+        self.assertEqual(cache.get('user', '1'), 10)
+        cache.set('user', 3, 30)
+
+        # The least recently used one goes
+        self.assertIsNone(cache.get('user', 2))
+        self.assertEqual(cache.get('user', 3), 30)
+        self.assertEqual(cache.stats(), {'size': 2, 'hits': 2, 'misses': 1})
+
+        # Invalidating the evicted entry leaves the others alone
+        cache.invalidate('user', 20)
+        self.assertEqual(cache.stats()['size'], 2)
+
+    def test_resolves_once(self):
+        cache = IdentityCache()
+        channel = SimpleNamespace(id=2, name='channel', guild=SimpleNamespace(id=1, name='Server'))
+
+        pk = cache.channel_id(channel)
+        with self.assertNumQueries(0):
+            self.assertEqual(cache.channel_id(channel), pk)
+
+        self.assertEqual(models.Channel.objects.get(pk=pk).server_id, cache.get('server', 1))
+
+    def test_signals_invalidate(self):
+        identities.clear()
+        self.addCleanup(identities.clear)
+
+        pk = identities.user_id(self.discord_user(1))
+        user = models.User.objects.get(pk=pk)
+
+        # Saves that don't touch the Discord ID keep the entry
+        user.save(update_fields=['first_name'])
+        self.assertEqual(identities.get('user', 1), pk)
+
+        user.discord_id = '2'
+        user.save()
+        self.assertIsNone(identities.get('user', 1))
+
+        identities.set('user', 2, pk)
+        user.delete()
+        self.assertIsNone(identities.get('user', 2))
+
+    def test_retry_stale(self):
+        cache = IdentityCache()
+        cache.set('user', 1, 10)
+        func = mock.Mock(side_effect=[IntegrityError('stale'), 'done'])
+
+        self.assertEqual(cache.retry_stale(func, 'argument', read_only=True), 'done')
+
+        self.assertEqual(func.call_args_list, [mock.call('argument', read_only=True)] * 2)
+        self.assertIsNone(cache.get('user', 1))
+
+    def test_retry_stale_once(self):
+        cache = IdentityCache()
+        func = mock.Mock(side_effect=IntegrityError('broken'))
+
+        with self.assertRaises(IntegrityError):
+            cache.retry_stale(func)
+
+        self.assertEqual(func.call_count, 2)
+
+class SchedulerTests(TestCase):
+    '''
+    The bot's schedule of attendees, with a standup every day at 9:00 for
+    a user in UTC and one in New York (UTC-4 in October).
+    '''
+    NOW = datetime.datetime(2026, 10, 14, 12, 0, tzinfo=datetime.timezone.utc)
+
+    @classmethod
+    def setUpTestData(cls):
+        standup_type = models.StandupType.objects.create(
+            name='Daily', command_name='daily', create_new_event_at=datetime.time(9),
+            create_on_saturday=True, create_on_sunday=True)
+        server = models.Server.objects.create(name='Server', discord_guild_id='1')
+        channel = models.Channel.objects.create(name='channel', server=server, discord_channel_id='2')
+        cls.utc = models.User.objects.create(username='3', discord_id='3', timezone='UTC')
+        cls.new_york = models.User.objects.create(username='4', discord_id='4', timezone='America/New_York')
+        cls.event = models.StandupEvent.objects.create(channel=channel, standup_type=standup_type, created_by=cls.utc)
+        cls.utc_att = models.Attendee.objects.create(standup=cls.event, user=cls.utc, created_by=cls.utc)
+        cls.new_york_att = models.Attendee.objects.create(standup=cls.event, user=cls.new_york, created_by=cls.utc)
+
+    def at(self, hour, days=0, second=0):
+        return self.NOW.replace(hour=hour, second=second) + datetime.timedelta(days=days)
+
+    def fire_at(self, scheduler, att):
+        return scheduler._entries[att.pk][0]
+
+    def notify(self, user):
+        standup, _ = models.Standup.objects.get_or_create(event=self.event, standup_date=self.NOW.date())
+        models.StandupParticipation.objects.create(standup=standup, user=user, notified=True)
+
+    def test_rebuild_catches_up(self):
+        scheduler = StandupScheduler()
+        scheduler.rebuild(now=self.NOW)
+
+        # Nobody was notified yet, the UTC user is due right away
+        self.assertEqual(self.fire_at(scheduler, self.utc_att), self.at(9, second=1))
+        self.assertEqual(self.fire_at(scheduler, self.new_york_att), self.at(13, second=1))
+
+    def test_rebuild_skips_notified(self):
+        self.notify(self.utc)
+
+        scheduler = StandupScheduler()
+        scheduler.rebuild(now=self.NOW)
+
+        self.assertEqual(self.fire_at(scheduler, self.utc_att), self.at(9, days=1, second=1))
+        self.assertEqual(self.fire_at(scheduler, self.new_york_att), self.at(13, second=1))
+        self.assertEqual(scheduler.pop_due(now=self.NOW), [])
+
+    def test_refresh_skips_notified(self):
+        scheduler = StandupScheduler()
+        scheduler.rebuild(now=self.NOW)
+        self.assertEqual(len(scheduler.pop_due(now=self.NOW)), 1)
+
+        self.notify(self.utc)
+        scheduler.mark('events', self.event.pk)
+        scheduler.refresh(now=self.NOW)
+
+        self.assertEqual(scheduler.pop_due(now=self.NOW), [])
+        self.assertEqual(self.fire_at(scheduler, self.utc_att), self.at(9, days=1, second=1))
+
+    def test_pop_due(self):
+        scheduler = StandupScheduler()
+        scheduler.rebuild(now=self.at(8))
+
+        self.assertEqual(scheduler.next_due(), self.at(9, second=1))
+        self.assertEqual(scheduler.pop_due(now=self.at(9)), [])
+        self.assertEqual([att.pk for att in scheduler.pop_due(now=self.at(10))], [self.utc_att.pk])
+
+        # Popping schedules the next day right away, so nothing is due twice
+        self.assertEqual(scheduler.pop_due(now=self.at(10)), [])
+        self.assertEqual(self.fire_at(scheduler, self.utc_att), self.at(9, days=1, second=1))
+        self.assertEqual(scheduler.next_due(), self.at(13, second=1))
+
+    def test_muted(self):
+        models.User.objects.filter(pk=self.utc.pk).update(mute_until=self.NOW.date() + datetime.timedelta(days=2))
+
+        scheduler = StandupScheduler()
+        scheduler.rebuild(now=self.NOW)
+
+        self.assertEqual(self.fire_at(scheduler, self.utc_att), self.at(9, days=3, second=1))
+
+    def test_retry(self):
+        scheduler = StandupScheduler()
+        scheduler.rebuild(now=self.NOW)
+        due = scheduler.pop_due(now=self.NOW)
+
+        scheduler.retry(due, 10, now=self.NOW)
+
+        self.assertEqual(scheduler.next_due(), self.NOW + datetime.timedelta(seconds=10))
+        self.assertEqual(scheduler.pop_due(now=self.NOW + datetime.timedelta(seconds=9)), [])
+        self.assertEqual([att.pk for att in scheduler.pop_due(now=self.NOW + datetime.timedelta(seconds=10))], [self.utc_att.pk])
+
+    def test_refresh_dirty_only(self):
+        scheduler = StandupScheduler()
+        scheduler.rebuild(now=self.at(8))
+
+        # Changes without a signal are only seen once marked
+        models.User.objects.filter(pk=self.new_york.pk).update(timezone='Asia/Tokyo')
+        scheduler.refresh(now=self.at(8))
+        self.assertEqual(self.fire_at(scheduler, self.new_york_att), self.at(13, second=1))
+
+        scheduler.mark('users', self.new_york.pk)
+        with self.assertNumQueries(2):
+            scheduler.refresh(now=self.at(8))
+        # 9:00 in Tokyo passed already, so it's due right away
+        self.assertEqual(self.fire_at(scheduler, self.new_york_att), self.at(0, second=1))
+
+        # The outdated heap item at 13:00 is skipped
+        self.assertEqual(len(scheduler.pop_due(now=self.at(14))), 2)
+        self.assertEqual(scheduler.next_due(), self.at(0, days=1, second=1))
+
+    def test_refresh_removes(self):
+        scheduler = StandupScheduler()
+        scheduler.rebuild(now=self.at(8))
+
+        models.Attendee.objects.filter(pk=self.new_york_att.pk).update(active=False)
+        scheduler.mark('attendees', self.new_york_att.pk)
+        scheduler.refresh(now=self.at(8))
+
+        self.assertNotIn(self.new_york_att.pk, scheduler._entries)
+        self.assertEqual([att.pk for att in scheduler.pop_due(now=self.at(14))], [self.utc_att.pk])
+
+    def test_signals_mark(self):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        scheduler = StandupScheduler()
+        scheduler.connect(loop)
+        self.addCleanup(scheduler.disconnect)
+
+        self.new_york.mute_until = self.NOW.date()
+        self.new_york.save()
+
+        self.assertEqual(scheduler._dirty['users'], set([self.new_york.pk]))
+
+    def test_mark_wakes_wait(self):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        scheduler = StandupScheduler()
+        scheduler.connect(loop)
+        self.addCleanup(scheduler.disconnect)
+
+        loop.call_later(0.01, scheduler.mark, 'users', self.utc.pk)
+        started = loop.time()
+        loop.run_until_complete(scheduler.wait(5))
+
+        self.assertLess(loop.time() - started, 1)
+
+    def test_mark_during_rebuild(self):
+        scheduler = StandupScheduler()
+        attendees = scheduler._attendees
+
+        def marked_while_querying():
+            scheduler.mark('users', self.utc.pk)
+            return attendees()
+
+        with mock.patch.object(scheduler, '_attendees', marked_while_querying):
+            scheduler.rebuild(now=self.NOW)
+
+        # The query may have read the old row, so it's refreshed again
+        self.assertEqual(scheduler._dirty['users'], set([self.utc.pk]))
+
+
+class LeaseTests(TestCase):
+    '''
+    The election of one bot replica per shard.
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        standup_type = models.StandupType.objects.create(name='Daily', command_name='daily', publish_to_channel=True)
+        server = models.Server.objects.create(name='Server', discord_guild_id='1')
+        channel = models.Channel.objects.create(name='channel', server=server, discord_channel_id='2')
+        user = models.User.objects.create(username='3', discord_id='3')
+        event = models.StandupEvent.objects.create(channel=channel, standup_type=standup_type, created_by=user)
+        cls.standup = models.Standup.objects.create(event=event, standup_date=datetime.date(2026, 10, 14))
+
+    def expire(self, name='test'):
+        models.BotLease.objects.filter(name=name).update(expires_at=timezone.now() - datetime.timedelta(seconds=1))
+
+    def test_acquire_and_standby(self):
+        first, second = Lease('test', holder='first'), Lease('test', holder='second')
+
+        self.assertTrue(first.heartbeat())
+        self.assertTrue(first.held)
+        self.assertFalse(second.heartbeat())
+        self.assertFalse(second.held)
+
+        # Renewing keeps the token
+        token = first.token
+        self.assertTrue(first.heartbeat())
+        self.assertEqual(first.token, token)
+
+    def test_takeover(self):
+        first, second = Lease('test', holder='first'), Lease('test', holder='second')
+        first.heartbeat()
+        token = first.token
+
+        self.expire()
+        self.assertTrue(second.heartbeat())
+        self.assertEqual(second.token, token + 1)
+
+        # The old holder finds out on its next heartbeat and stands by
+        self.assertFalse(first.heartbeat())
+        self.assertIsNone(first.token)
+        self.assertFalse(first.held)
+
+    def test_fence(self):
+        first, second = Lease('test', holder='first'), Lease('test', holder='second')
+        first.heartbeat()
+        first.fence()
+
+        self.expire()
+        second.heartbeat()
+
+        with self.assertRaises(LeaseLost):
+            first.fence()
+        second.fence()
+
+    def test_release(self):
+        first, second = Lease('test', holder='first'), Lease('test', holder='second')
+        first.heartbeat()
+        first.release()
+
+        self.assertFalse(first.held)
+        self.assertTrue(second.heartbeat())
+
+    def test_names_independent(self):
+        self.assertTrue(Lease('run_bot:0/2', holder='first').heartbeat())
+        self.assertTrue(Lease('run_bot:1/2', holder='second').heartbeat())
+
+    def test_mark_published_fenced(self):
+        old, new = Lease('test', holder='old'), Lease('test', holder='new')
+        self.assertTrue(old.heartbeat())
+
+        # Taken over while the old holder was still publishing
+        self.expire()
+        self.assertTrue(new.heartbeat())
+
+        with self.assertRaises(LeaseLost):
+            self.standup.mark_published([(0, '100', 'Summary')], '100', lease=old)
+
+        self.assertFalse(self.standup.summary_messages.exists())
+        self.assertIsNone(models.Standup.objects.get(pk=self.standup.pk).pinned_message_id)
+
+        self.standup.mark_published([(0, '101', 'Summary')], '101', lease=new)
+        self.assertEqual(models.Standup.objects.get(pk=self.standup.pk).pinned_message_id, '101')
+
+
+def initiate_one_by_one(event, now):
+    '''
+    The per-attendee `StandupEvent.initiate` the bulk path replaced, as it
+    was before, except that it runs at the given moment.
+    '''
+    notified = []
+
+    for att in event.attending.filter(active=True).order_by('id'):
+        aware_dt = timezone.localtime(now, timezone=att.user.timezone)
+        s = event.standups.filter(standup_date=aware_dt.date()).first()
+
+        if not event.standup_type.in_timeslot(aware_dt):
+            continue
+
+        if not s and event.standup_type.minimum_days_between_standups > 0:
+            treshold = aware_dt - datetime.timedelta(days=event.standup_type.minimum_days_between_standups)
+            if event.standups.filter(standup_date__gte=treshold.date()).exists():
+                continue
+
+        if att.user.mute_until and att.user.mute_until >= aware_dt.date():
+            continue
+
+        if not s:
+            s = models.Standup(event=event, standup_date=aware_dt.date())
+            s.save()
+
+        if models.StandupParticipation.objects.filter(standup=s, user=att.user, notified=True).exists():
+            continue
+
+        p, created = models.StandupParticipation.objects.get_or_create(standup=s, user=att.user, defaults={'read_only': att.read_only})
+
+        if aware_dt.time() > event.standup_type.create_new_event_at and not p.notified:
+            notified.append(p)
+            p.notified = True
+            p.save()
+
+    return notified
+
+
+class InitiateTests(TestCase):
+    '''
+    The bulk initiation gives the same standups, participations and
+    notifications as initiating every attendee one by one.
+    '''
+    # Thursday morning in UTC, every step moves 7 hours on into the weekend
+    START = datetime.datetime(2026, 10, 15, 6, 0, tzinfo=datetime.timezone.utc)
+    STEPS = 9
+
+    @classmethod
+    def setUpTestData(cls):
+        server = models.Server.objects.create(name='Server', discord_guild_id='1')
+        discord_ids = itertools.count(100)
+
+        def user(tz, **fields):
+            did = str(next(discord_ids))
+            return models.User.objects.create(username=did, discord_id=did, timezone=tz, **fields)
+
+        utc = user('UTC')
+        new_york = user('America/New_York')
+        tokyo = user('Asia/Tokyo')
+        muted = user('Europe/Amsterdam', mute_until=datetime.date(2026, 10, 16))
+        users = [utc, new_york, tokyo, muted]
+
+        types = [
+            # Every day, weekdays only, and every other day at most
+            models.StandupType.objects.create(name='Daily', command_name='daily', create_new_event_at=datetime.time(9), create_on_saturday=True, create_on_sunday=True),
+            models.StandupType.objects.create(name='Weekdays', command_name='weekdays', create_new_event_at=datetime.time(8, 30)),
+            models.StandupType.objects.create(name='Sparse', command_name='sparse', create_new_event_at=datetime.time(0), create_on_saturday=True, minimum_days_between_standups=2),
+        ]
+
+        for standup_type in types:
+            channel = models.Channel.objects.create(name=standup_type.command_name, server=server, discord_channel_id=str(next(discord_ids)))
+            event = models.StandupEvent.objects.create(channel=channel, standup_type=standup_type, created_by=utc)
+            for i, u in enumerate(users):
+                models.Attendee.objects.create(standup=event, user=u, created_by=utc, read_only=(i == 1))
+
+            inactive = user('UTC')
+            models.Attendee.objects.create(standup=event, user=inactive, created_by=utc, active=False)
+
+        # The sparse standup ran the day before the first step
+        sparse = models.StandupEvent.objects.get(standup_type__command_name='sparse')
+        models.Standup.objects.create(event=sparse, standup_date=datetime.date(2026, 10, 14))
+
+    def snapshot(self):
+        return (
+            set(models.Standup.objects.values_list('event_id', 'standup_date')),
+            set(models.StandupParticipation.objects.values_list('standup__event_id', 'standup__standup_date', 'user_id', 'read_only', 'notified')),
+        )
+
+    def notified(self, participations):
+        return sorted([(p.standup.event_id, p.standup.standup_date, p.user_id) for p in participations])
+
+    def run_steps(self, initiate):
+        '''
+        Runs `initiate(now)` at every step and returns what was notified and
+        the rows after every step. Rolls everything back afterwards.
+        '''
+        results = []
+
+        with transaction.atomic():
+            for step in range(self.STEPS):
+                now = self.START + datetime.timedelta(hours=7 * step)
+                results.append((now, self.notified(initiate(now)), self.snapshot()))
+            transaction.set_rollback(True)
+
+        return results
+
+    def assertSameSteps(self, expected, actual):
+        for (now, expected_notified, expected_rows), (_, notified, rows) in zip(expected, actual):
+            with self.subTest(now=now):
+                self.assertEqual(notified, expected_notified)
+                self.assertEqual(rows, expected_rows)
+
+    def one_by_one(self, now):
+        notified = []
+        for event in models.StandupEvent.objects.order_by('id'):
+            notified.extend(initiate_one_by_one(event, now))
+        return notified
+
+    def test_bulk_matches_one_by_one(self):
+        expected = self.run_steps(self.one_by_one)
+
+        # Something happens in every step, or the comparison proves little
+        self.assertTrue(all(notified for _, notified, _ in expected[:4]))
+
+        self.assertSameSteps(expected, self.run_steps(
+            lambda now: models.StandupEvent.objects.initiate_attendees(models.Attendee.objects.all(), now=now)))
+
+    def test_initiate_matches_one_by_one(self):
+        def initiate(now):
+            notified = []
+            with mock.patch('django.utils.timezone.now', return_value=now):
+                for event in models.StandupEvent.objects.order_by('id'):
+                    notified.extend(event.initiate()[1])
+            return notified
+
+        self.assertSameSteps(self.run_steps(self.one_by_one), self.run_steps(initiate))
+
+    def test_skipped_attendees(self):
+        now = self.START + datetime.timedelta(hours=4)
+        notified = models.StandupEvent.objects.initiate_attendees(models.Attendee.objects.all(), now=now)
+        users = dict([(u.discord_id, u.pk) for u in models.User.objects.all()])
+
+        daily = [p.user_id for p in notified if p.standup.event.standup_type.command_name == 'daily']
+        # 10:00 UTC, 06:00 New York, 19:00 Tokyo, muted in Amsterdam
+        self.assertEqual(sorted(daily), sorted([users['100'], users['102']]))
+
+        # New York isn't due yet but already has a participation, the inactive one hasn't
+        participations = models.StandupParticipation.objects.filter(standup__event__standup_type__command_name='daily')
+        self.assertEqual(
+            set(participations.values_list('user_id', 'notified')),
+            set([(users['100'], True), (users['101'], False), (users['102'], True)]))
+        self.assertTrue(participations.get(user_id=users['101']).read_only)
+
+        # The sparse standup ran yesterday, nothing for the minimum days
+        self.assertFalse(models.Standup.objects.filter(event__standup_type__command_name='sparse', standup_date__gt=datetime.date(2026, 10, 14)).exists())
+
+    def test_query_count(self):
+        now = self.START + datetime.timedelta(hours=4)
+
+        # Three times as many attendees take the same number of queries
+        for copies in (0, 2):
+            with self.subTest(copies=copies), transaction.atomic():
+                for att in list(models.Attendee.objects.select_related('user')):
+                    for i in range(copies):
+                        copy = models.User.objects.create(username='%d-%d' % (att.pk, i), timezone=att.user.timezone, mute_until=att.user.mute_until)
+                        models.Attendee.objects.create(standup_id=att.standup_id, user=copy, created_by_id=att.created_by_id, active=att.active)
+
+                # Attendees, standups, the standup insert, its listing (two) and
+                # read back, participations, the participation insert, its
+                # listing (two), the notified ones and the savepoint around it
+                with self.assertNumQueries(13):
+                    models.StandupEvent.objects.initiate_attendees(models.Attendee.objects.all(), now=now)
+                transaction.set_rollback(True)
+
+
+class FakeNotFound(Exception):
+    status = 404
+
+
+class FakeDispatcher(object):
+    '''
+    Stands in for the `MessageDispatcher`, records every Discord call. Edits
+    of the `deleted` message IDs fail like messages deleted by hand, pins
+    fail while `pin_fails` is set.
+    '''
+    def __init__(self):
+        self.ids = itertools.count(1000)
+        self.calls = []
+        self.deleted = set()
+        self.pin_fails = False
+
+    async def send(self, target, content):
+        self.calls.append(('send', content))
+        return SimpleNamespace(id=next(self.ids))
+
+    async def edit(self, http, channel_id, message_id, content):
+        self.calls.append(('edit', message_id, content))
+        if message_id in self.deleted:
+            raise FakeNotFound()
+
+    async def delete(self, http, channel_id, message_id):
+        self.calls.append(('delete', message_id))
+
+    async def pin(self, http, channel_id, message_id):
+        self.calls.append(('pin', message_id))
+        if self.pin_fails:
+            raise FakeNotFound()
+
+
+class InlineDatabase(object):
+
+    async def run(self, func, *args, **kwargs):
+        return func(*args, **kwargs)
+
+
+class SummaryTests(TestCase):
+    '''
+    Publishing a summary sends it once and from then on only edits what
+    changed.
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        standup_type = models.StandupType.objects.create(name='Daily', command_name='daily', publish_to_channel=True)
+        cls.question = models.StandupQuestion.objects.create(standup_type=standup_type, question='What did you do?')
+        server = models.Server.objects.create(name='Server', discord_guild_id='1')
+        channel = models.Channel.objects.create(name='channel', server=server, discord_channel_id='2')
+        users = [models.User.objects.create(username=str(10 + i), discord_id=str(10 + i), first_name='User %d' % i) for i in range(3)]
+        event = models.StandupEvent.objects.create(channel=channel, standup_type=standup_type, created_by=users[0])
+        cls.standup = models.Standup.objects.create(event=event, standup_date=datetime.date(2026, 10, 14))
+
+        # Every answer needs a message of its own
+        for user in users:
+            participation = models.StandupParticipation.objects.create(standup=cls.standup, user=user, completed=True)
+            models.StandupParticipationAnswer.objects.create(participation=participation, question=cls.question, answer=user.first_name * 200)
+
+    def setUp(self):
+        self.dispatcher = FakeDispatcher()
+        self.bot = SimpleNamespace(http=None, get_channel=lambda id: SimpleNamespace(id=id))
+
+    def publish(self):
+        self.dispatcher.calls = []
+        standup = models.Standup.objects.get(pk=self.standup.pk)
+        return asyncio.get_event_loop().run_until_complete(standup.send_summary(self.bot, InlineDatabase(), self.dispatcher))
+
+    def published(self):
+        return list(self.standup.summary_messages.order_by('position').values_list('position', 'discord_message_id'))
+
+    def answer(self, first_name):
+        return models.StandupParticipationAnswer.objects.filter(participation__user__first_name=first_name)
+
+    def test_first_publish(self):
+        self.assertTrue(self.publish())
+
+        sends = [call for call in self.dispatcher.calls if call[0] == 'send']
+        self.assertEqual(len(sends), 3)
+        self.assertEqual(self.dispatcher.calls[3:], [('pin', '1000')])
+        self.assertEqual(self.published(), [(0, '1000'), (1, '1001'), (2, '1002')])
+        self.assertEqual(models.Standup.objects.get(pk=self.standup.pk).pinned_message_id, '1000')
+
+    def test_edit_changed_only(self):
+        self.publish()
+        self.answer('User 2').update(answer='Changed ' * 150)
+
+        self.assertTrue(self.publish())
+
+        self.assertEqual([call[:2] for call in self.dispatcher.calls], [('edit', '1002')])
+        self.assertEqual(self.published(), [(0, '1000'), (1, '1001'), (2, '1002')])
+
+    def test_edit_moves_up(self):
+        self.publish()
+        self.answer('User 1').update(answer='Short')
+
+        self.assertTrue(self.publish())
+
+        # The short answer fits in the first message, the last one moves up
+        self.assertEqual([call[:2] for call in self.dispatcher.calls], [('edit', '1000'), ('edit', '1001'), ('delete', '1002')])
+        self.assertEqual(self.published(), [(0, '1000'), (1, '1001')])
+
+    def test_delete_surplus(self):
+        self.publish()
+        self.answer('User 2').delete()
+
+        self.assertTrue(self.publish())
+
+        self.assertEqual(self.dispatcher.calls, [('delete', '1002')])
+        self.assertEqual(self.published(), [(0, '1000'), (1, '1001')])
+
+    def test_resend_deleted_by_hand(self):
+        self.publish()
+        self.answer('User 1').update(answer='Changed ' * 150)
+        self.dispatcher.deleted.add('1001')
+
+        self.assertTrue(self.publish())
+
+        self.assertEqual([call[0] for call in self.dispatcher.calls], ['edit', 'send'])
+        self.assertEqual(self.dispatcher.calls[0][2], self.dispatcher.calls[1][1])
+        self.assertEqual(self.published(), [(0, '1000'), (1, '1003'), (2, '1002')])
+        # Only the first message is pinned, and it's still the same one
+        self.assertEqual(models.Standup.objects.get(pk=self.standup.pk).pinned_message_id, '1000')
+
+    def test_failed_pin_retried(self):
+        self.dispatcher.pin_fails = True
+        self.assertFalse(self.publish())
+
+        self.assertIsNone(models.Standup.objects.get(pk=self.standup.pk).pinned_message_id)
+        self.assertEqual(self.published(), [(0, '1000'), (1, '1001'), (2, '1002')])
+        self.assertTrue(models.StandupSummaryRebuild.objects.filter(standup=self.standup).exists())
+
+        self.dispatcher.pin_fails = False
+        self.assertTrue(self.publish())
+
+        # Nothing changed, only the pin is done again
+        self.assertEqual(self.dispatcher.calls, [('pin', '1000')])
+        self.assertEqual(models.Standup.objects.get(pk=self.standup.pk).pinned_message_id, '1000')
+
+
+class PackMessagesTests(TestCase):
+
+    def test_packs_blocks(self):
+        self.assertEqual(models.pack_messages(['a' * 10, 'b' * 10, 'c' * 10], limit=25), ['%s\n%s' % ('a' * 10, 'b' * 10), 'c' * 10])
+
+    def test_splits_on_lines(self):
+        block = '\n'.join(['line %d' % i for i in range(10)])
+        messages = models.pack_messages(['header', block], limit=20)
+
+        self.assertTrue(all(len(message) <= 20 for message in messages))
+        self.assertEqual('\n'.join(messages), 'header\n%s' % block)
+        self.assertEqual(messages[:2], ['header', 'line 0\nline 1\nline 2'])
+
+    def test_keeps_mentions(self):
+        mentions = ', '.join(['<@%d>' % (10 ** 17 + i) for i in range(100)])
+        messages = models.pack_messages(['Not filled in (yet) by: %s' % mentions], limit=200)
+
+        self.assertTrue(all(len(message) <= 200 for message in messages))
+        for message in messages[1:]:
+            self.assertTrue(message.startswith('<@'))
+        self.assertEqual(' '.join(messages), 'Not filled in (yet) by: %s' % mentions)
+
+    def test_cuts_long_words(self):
+        self.assertEqual(models.pack_messages(['x' * 45], limit=20), ['x' * 20, 'x' * 20, 'x' * 5])
+
+
+class DatabaseExecutorTests(SimpleTestCase):
+    '''
+    The bot's database work runs on a thread pool, next to the event loop.
+    '''
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def run_job(self, db, func, *args):
+        return self.loop.run_until_complete(db.run(func, *args))
+
+    def test_runs_on_pool(self):
+        db = DatabaseExecutor(max_workers=2)
+        self.addCleanup(db.shutdown)
+
+        with mock.patch('standup.executor.close_old_connections') as close:
+            name = self.run_job(db, lambda: threading.current_thread().name)
+
+        self.assertTrue(name.startswith('standup-db'))
+        # Stale connections are closed before and after, like around a request
+        self.assertEqual(close.call_count, 2)
+
+    def test_inline(self):
+        db = DatabaseExecutor(max_workers=0)
+        self.assertEqual(self.run_job(db, lambda: threading.current_thread().name), threading.current_thread().name)
+
+    def test_raises(self):
+        db = DatabaseExecutor(max_workers=1)
+        self.addCleanup(db.shutdown)
+
+        def fail():
+            raise ValueError('broken')
+
+        with self.assertRaisesMessage(ValueError, 'broken'):
+            self.run_job(db, fail)
+
+    def test_loop_not_blocked(self):
+        db = DatabaseExecutor(max_workers=1)
+        self.addCleanup(db.shutdown)
+        ticks = []
+
+        async def ticker():
+            for _ in range(5):
+                await asyncio.sleep(0.01)
+                ticks.append(self.loop.time())
+
+        async def both():
+            job = asyncio.ensure_future(db.run(time.sleep, 0.2), loop=self.loop)
+            started = self.loop.time()
+            await ticker()
+            self.assertLess(ticks[-1] - started, 0.15)
+            await job
+
+        self.loop.run_until_complete(both())
+
+
+def http_error(status):
+    return discord.HTTPException(SimpleNamespace(status=status, reason='Error', headers={}), '')
+
+
+class MessageDispatcherTests(SimpleTestCase):
+    '''
+    The queue the bot's Discord calls go through.
+    '''
+    def setUp(self):
+        # The dispatcher's queue and futures use the current event loop
+        previous = asyncio.get_event_loop()
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.addCleanup(asyncio.set_event_loop, previous)
+        self.addCleanup(self.loop.close)
+
+        self.dispatcher = MessageDispatcher(workers=4, rate=1000, retries=2, backoff=0)
+
+    def run_dispatcher(self, coro):
+        async def scenario():
+            workers = asyncio.ensure_future(self.dispatcher.run())
+            try:
+                return await coro
+            finally:
+                workers.cancel()
+                await asyncio.gather(workers, return_exceptions=True)
+
+        return self.loop.run_until_complete(scenario())
+
+    def test_route_order(self):
+        received = {}
+        busy = {'now': 0, 'max': 0}
+
+        def target(id):
+            async def send(content):
+                busy['now'] += 1
+                busy['max'] = max(busy['max'], busy['now'])
+                await asyncio.sleep(random.uniform(0, 0.005))
+                received.setdefault(id, []).append(content)
+                busy['now'] -= 1
+            return SimpleNamespace(id=id, send=send)
+
+        targets = [target(i) for i in range(3)]
+        sends = [self.dispatcher.send(t, n) for n in range(10) for t in targets]
+        self.run_dispatcher(asyncio.gather(*sends))
+
+        # Every route in order, the routes themselves side by side
+        self.assertEqual(received, dict([(i, list(range(10))) for i in range(3)]))
+        self.assertGreater(busy['max'], 1)
+        self.assertEqual(self.dispatcher.queue_depth, 0)
+
+    def test_retries_server_errors(self):
+        calls = []
+
+        async def flaky():
+            calls.append(None)
+            if len(calls) < 3:
+                raise http_error(503)
+            return 'sent'
+
+        self.assertEqual(self.run_dispatcher(self.dispatcher.submit(('channel', 1), flaky)), 'sent')
+        self.assertEqual(self.dispatcher.retried, 2)
+
+    def test_retries_bounded(self):
+        calls = []
+
+        async def down():
+            calls.append(None)
+            raise aiohttp.ClientConnectionError()
+
+        with self.assertRaises(aiohttp.ClientConnectionError):
+            self.run_dispatcher(self.dispatcher.submit(('channel', 1), down))
+
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(self.dispatcher.failed, 1)
+
+    def test_no_retry(self):
+        # Client errors fail right away, discord.py already retried the others
+        for status in (403, 404, 429, 500, 502):
+            calls = []
+
+            async def fail():
+                calls.append(None)
+                raise http_error(status)
+
+            with self.subTest(status=status):
+                with self.assertRaises(discord.HTTPException):
+                    self.run_dispatcher(self.dispatcher.submit(('channel', 1), fail))
+                self.assertEqual(len(calls), 1)
+
+    def test_missing_target(self):
+        with self.assertRaises(MissingTarget):
+            self.run_dispatcher(self.dispatcher.send(None, 'Hello'))
+
+    def test_cancelled_worker(self):
+        async def hang():
+            await asyncio.sleep(60)
+
+        async def scenario():
+            workers = asyncio.ensure_future(self.dispatcher.run())
+            future = self.dispatcher.submit(('channel', 1), hang)
+            await asyncio.sleep(0.01)
+
+            workers.cancel()
+            await asyncio.gather(workers, return_exceptions=True)
+            return workers, future
+
+        workers, future = self.loop.run_until_complete(scenario())
+
+        # The workers stopped instead of reporting a failed call
+        self.assertTrue(workers.cancelled())
+        self.assertTrue(future.cancelled())
+        self.assertEqual(self.dispatcher.failed, 0)
+
+
+class StandupFormTests(TestCase):
+    '''
+    Saving the answers of a standup.
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        standup_type = models.StandupType.objects.create(name='Daily', command_name='daily')
+        cls.questions = [models.StandupQuestion.objects.create(standup_type=standup_type, question='Question %d?' % i) for i in range(3)]
+        server = models.Server.objects.create(name='Server', discord_guild_id='1')
+        channel = models.Channel.objects.create(name='channel', server=server, discord_channel_id='2')
+        user = models.User.objects.create(username='3', discord_id='3')
+        event = models.StandupEvent.objects.create(channel=channel, standup_type=standup_type, created_by=user)
+        standup = models.Standup.objects.create(event=event, standup_date=datetime.date(2026, 10, 14))
+        cls.participation = models.StandupParticipation.objects.create(standup=standup, user=user)
+
+    def submit(self, answers):
+        form = StandupForm(
+            dict([('question_%d' % q.id, answer) for q, answer in zip(self.questions, answers)]),
+            participation=models.StandupParticipation.objects.get(pk=self.participation.pk))
+        self.assertTrue(form.is_valid())
+        return form
+
+    def answers(self):
+        return list(self.participation.answers.order_by('question__order').values_list('answer', flat=True))
+
+    def test_save_and_update(self):
+        self.submit(['a', 'b', 'c']).save()
+        self.assertEqual(self.answers(), ['a', 'b', 'c'])
+
+        self.submit(['d', '', 'f']).save()
+        self.assertEqual(self.answers(), ['d', '', 'f'])
+        self.assertTrue(models.StandupParticipation.objects.get(pk=self.participation.pk).completed)
+
+    def test_racing_first_submit(self):
+        form = self.submit(['mine', 'mine too', 'and mine'])
+        bulk_update = models.StandupParticipationAnswer.objects.bulk_update
+
+        def racing(*args, **kwargs):
+            # Another submit saved an answer after this one looked for them
+            models.StandupParticipationAnswer.objects.create(participation=self.participation, question=self.questions[1], answer='theirs')
+            return bulk_update(*args, **kwargs)
+
+        with mock.patch.object(models.StandupParticipationAnswer.objects, 'bulk_update', racing):
+            form.save()
+
+        self.assertEqual(self.answers(), ['mine', 'mine too', 'and mine'])
+
+
+class ChangeFeedTests(SimpleTestCase):
+    '''
+    The bot's end of the change feed, as used without PostgreSQL.
+    '''
+    def test_datagrams(self):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        received = []
+        listener = changefeed.ChangeFeedListener(lambda kind, pk: received.append((kind, pk)))
+
+        with self.settings(CHANGEFEED_PORT=47399):
+            self.assertTrue(loop.run_until_complete(listener.start(loop)))
+            self.addCleanup(listener.stop)
+
+            # Datagrams can get lost unnoticed, so the bot keeps polling
+            self.assertFalse(listener.reliable)
+
+            changefeed._send_datagram('["elsewhere", "summary", 1]')
+            changefeed._send_datagram('["%s", "summary", 2]' % changefeed.ORIGIN)
+            loop.run_until_complete(asyncio.sleep(0.05))
+
+        self.assertEqual(received, [('summary', 1)])
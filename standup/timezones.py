@@ -0,0 +1,156 @@
+import datetime
+import re
+
+import pytz
+from django.utils import timezone
+
+from standup.models import pack_messages
+
+
+OFFSET_RE = re.compile(r'^(?:utc|gmt)?\s*(?:([+-])\s*(\d{1,2})(?::?(\d{2}))?)?$')
+
+
+def trigrams(text):
+    text = '  %s ' % text
+    return set([text[i:i + 3] for i in range(len(text) - 2)])
+
+
+def format_offset(offset):
+    minutes = int(offset.total_seconds()) // 60
+    sign = '-' if minutes < 0 else '+'
+    return 'UTC%s%02d:%02d' % (sign, abs(minutes) // 60, abs(minutes) % 60)
+
+
+class TimezoneCatalog(object):
+    '''
+    All timezones the bot accepts, with the `!timezones` listing already cut
+    into Discord messages and a trigram index for `!findtimezone`. Matches
+    are ranked on the city, the region and the full name, or on the current
+    UTC offset (`+2`, `UTC-05:30`). Offsets change with daylight saving time,
+    so everything is rebuilt once the catalog is a day old.
+    '''
+    max_age = datetime.timedelta(days=1)
+
+    def __init__(self, names=None):
+        self.names = list(names or pytz.common_timezones)
+        self.build()
+
+    def build(self, now=None):
+        self.built_at = now or timezone.now()
+
+        self.entries = []
+        self.by_name = {}
+        self.index = {}
+        self.offsets = {}
+
+        for i, name in enumerate(self.names):
+            offset = self.built_at.astimezone(pytz.timezone(name)).utcoffset()
+            parts = name.lower().replace('_', ' ').split('/')
+            key = ' '.join(parts)
+            self.entries.append({
+                'name': name,
+                'key': key,
+                'grams': trigrams(key),
+                'city': parts[-1],
+                'region': parts[0],
+                'offset': offset,
+            })
+            self.by_name[name] = self.entries[-1]
+            self.offsets.setdefault(offset, []).append(i)
+
+            for gram in self.entries[-1]['grams']:
+                self.index.setdefault(gram, set()).add(i)
+
+        blocks = []
+        regions = {}
+        for entry in self.entries:
+            regions.setdefault(entry['name'].split('/')[0], []).append('`%s`' % entry['name'])
+
+        for region, zones in regions.items():
+            # One line per region, wrapped so a line always fits in a message
+            line = '**%s**: ' % region
+            for zone in zones:
+                if len(line) + len(zone) + 2 > 1900:
+                    blocks.append(line.rstrip(', '))
+                    line = ''
+                line += '%s, ' % zone
+            blocks.append(line.rstrip(', '))
+
+        self.messages = pack_messages(blocks)
+
+    def refresh(self):
+        if timezone.now() - self.built_at >= self.max_age:
+            self.build()
+
+    def listing(self):
+        '''
+        Returns the messages listing all timezones.
+        '''
+        self.refresh()
+        return self.messages
+
+    def parse_offset(self, query):
+        match = OFFSET_RE.match(query)
+        if not match or not (match.group(1) or query.startswith(('utc', 'gmt'))):
+            return None
+
+        sign, hours, minutes = match.groups()
+        offset = datetime.timedelta(hours=int(hours or 0), minutes=int(minutes or 0))
+        return -offset if sign == '-' else offset
+
+    def search(self, query, limit=10):
+        '''
+        Returns the names of the best matching timezones, best first.
+        '''
+        self.refresh()
+        query = ' '.join(query.lower().replace('_', ' ').replace('/', ' ').split())
+        if not query:
+            return []
+
+        scores = {}
+
+        offset = self.parse_offset(query)
+        if offset is not None:
+            for i in self.offsets.get(offset, []):
+                scores[i] = 1.0
+
+        query_grams = trigrams(query)
+        candidates = set()
+        for gram in query_grams:
+            candidates.update(self.index.get(gram, ()))
+
+        for i in candidates:
+            entry = self.entries[i]
+            score = len(query_grams & entry['grams']) / float(len(query_grams | entry['grams']))
+
+            if entry['city'] == query:
+                score += 3
+            elif entry['city'].startswith(query):
+                score += 2
+            elif entry['region'] == query or entry['key'].startswith(query):
+                score += 1.5
+            elif query in entry['key']:
+                score += 1
+
+            if score > 0.2:
+                scores[i] = max(scores.get(i, 0), score)
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], self.entries[item[0]]['name']))
+        return [self.entries[i]['name'] for i, _ in ranked[:limit]]
+
+    def describe(self, name):
+        return '`%s` (%s)' % (name, format_offset(self.by_name[name]['offset']))
+
+    def search_message(self, query, limit=10):
+        '''
+        Returns a single message with the best matches for the query.
+        '''
+        matches = self.search(query, limit=limit)
+        query = query[:100]
+
+        if not matches:
+            return 'No timezones found for `%s`, use `!timezones` to see all of them.' % query
+
+        lines = ['**Found the following timezones for `%s`:**' % query]
+        lines.extend([self.describe(name) for name in matches])
+        return '\n'.join(lines)
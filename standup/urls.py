@@ -1,9 +1,11 @@
 from django.contrib import admin
 from django.urls import path
 from . import views
+from . import metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics/', metrics.metrics_view, name='metrics'),
     path('form/<token>/', views.StandupFormView.as_view(), name='standup_form'),
     path('private/<token>/', views.PrivateStandupView.as_view(), name='private_standup'),
     path('<server>/<channel>/<standup_type>/<date>/', views.PublicStandupView.as_view(), name='public_standup'),
@@ -1,22 +1,20 @@
 from django.views.generic import FormView, TemplateView, ListView
-from django.http import Http404
+from django.http import Http404, HttpResponse
+from django.db.models import Count, Prefetch, Q
 from django.urls import reverse
 from . import models
 from . import forms
+from . import cache
+from .pagination import KeysetPaginationMixin
 
 
-class HomeView(ListView):
+class HomeView(KeysetPaginationMixin, ListView):
     template_name = 'standups.html'
     model = models.Standup
-    paginate_by = 50
-    paginate_orphans = 4
     context_object_name = 'standups'
     
-    def get_queryset(self, bypass=False):
-        qs = models.Standup.objects.filter(event__standup_type__private=False).order_by('-created_at')
-
-        if bypass:
-            return qs
+    def get_queryset(self):
+        qs = models.Standup.objects.filter(event__standup_type__private=False)
 
         if self.request.GET.get('server'):
             qs = qs.filter(event__channel__server__slug=self.request.GET.get('server'))
@@ -25,31 +23,46 @@ class HomeView(ListView):
 
         return qs
 
+    def get_page_queryset(self, queryset):
+        # Everything a row needs to render and build its URL
+        return queryset.select_related('event__channel__server', 'event__standup_type').annotate(
+            active_count=Count('participants', filter=Q(participants__completed=True, participants__read_only=False)))
+
     def get_context_data(self, **kwargs):
         context = super(HomeView, self).get_context_data(**kwargs)
-        context['channels'] = set(self.get_queryset(bypass=True).values_list('event__channel__slug', 'event__channel__server__slug').order_by('event__channel__server__slug', 'event__channel__slug'))
+        context['channels'] = models.PublicChannelListing.objects.filter(standup_type__private=False)\
+            .values_list('channel__slug', 'channel__server__slug').order_by('channel__server__slug', 'channel__slug').distinct()
         if self.request.GET.get('channel') and self.request.GET.get('server'):
-            context['channel'] = models.Channel.objects.get(slug=self.request.GET.get('channel'), server__slug=self.request.GET.get('server'))
+            context['channel'] = models.Channel.objects.select_related('server').get(slug=self.request.GET.get('channel'), server__slug=self.request.GET.get('server'))
         return context
 
 
-class PrivateHomeView(ListView):
+class ParticipationMixin(object):
+    '''
+    Resolves the participation of the URL's single use token once per request,
+    together with everything the token views need around it. Every later call
+    returns the same instance.
+    '''
+
+    def get_participation(self):
+        if not hasattr(self, '_participation'):
+            self._participation = models.StandupParticipation.objects.filter(
+                single_use_token=self.kwargs.get('token')
+            ).select_related('user', 'standup__event__channel__server', 'standup__event__standup_type').first()
+        return self._participation
+
+
+class PrivateHomeView(ParticipationMixin, KeysetPaginationMixin, ListView):
     template_name = 'private_standups.html'
     model = models.StandupParticipation
-    paginate_by = 50
-    paginate_orphans = 4
     context_object_name = 'participations'
 
-    def get_queryset(self, bypass=False):
-        try:
-            p = models.StandupParticipation.objects.get(single_use_token=self.kwargs.get('token'))
-        except models.StandupParticipation.DoesNotExist:
+    def get_queryset(self):
+        p = self.get_participation()
+        if not p:
             return self.model.objects.none()
 
-        qs = self.model.objects.filter(user=p.user).order_by('-created_at').distinct()
-        
-        if bypass:
-            return qs
+        qs = self.model.objects.filter(user=p.user_id)
 
         if self.request.GET.get('server'):
             qs = qs.filter(standup__event__channel__server__slug=self.request.GET.get('server'))
@@ -57,26 +70,38 @@ class PrivateHomeView(ListView):
             qs = qs.filter(standup__event__channel__slug=self.request.GET.get('channel'))
 
         return qs
+
+    def get_page_queryset(self, queryset):
+        # Everything a row needs to render and build its URL
+        return queryset.select_related('standup__event__channel__server', 'standup__event__standup_type').annotate(
+            active_count=Count('standup__participants', filter=Q(standup__participants__completed=True, standup__participants__read_only=False)))
     
     def get_context_data(self, **kwargs):
         context = super(PrivateHomeView, self).get_context_data(**kwargs)
-        context['channels'] = set(self.get_queryset(bypass=True).values_list('standup__event__channel__slug', 'standup__event__channel__server__slug')\
-            .order_by('standup__event__channel__server__slug', 'standup__event__channel__slug'))
+        p = self.get_participation()
+        context['channels'] = models.UserChannelListing.objects.filter(user=p.user_id if p else None)\
+            .values_list('channel__slug', 'channel__server__slug').order_by('channel__server__slug', 'channel__slug')
         if self.request.GET.get('channel') and self.request.GET.get('server'):
-            context['channel'] = models.Channel.objects.get(slug=self.request.GET.get('channel'), server__slug=self.request.GET.get('server'))
+            context['channel'] = models.Channel.objects.select_related('server').get(slug=self.request.GET.get('channel'), server__slug=self.request.GET.get('server'))
         return context
 
 
-class StandupFormView(FormView):
+class StandupFormView(ParticipationMixin, FormView):
     template_name = 'standup_form.html'
     form_class = forms.StandupForm
 
+    def get_participation(self):
+        p = super(StandupFormView, self).get_participation()
+        if not p:
+            raise Http404('Single use token not valid')
+        return p
+
     def form_valid(self, form):
         form.save()
         return super(StandupFormView, self).form_valid(form)
 
     def get_success_url(self):
-        p = models.StandupParticipation.objects.get(single_use_token=self.kwargs.get('token'))
+        p = self.get_participation()
         if p.standup.event.standup_type.private:
             return p.get_home_url()
         else:
@@ -84,29 +109,54 @@ class StandupFormView(FormView):
 
     def get_form_kwargs(self):
         kwargs = super(StandupFormView, self).get_form_kwargs()
-        try:
-            p = models.StandupParticipation.objects.get(single_use_token=self.kwargs.get('token'))
-        except models.StandupParticipation.DoesNotExist:
-            raise Http404('Single use token not valid')
-        kwargs['participation'] = p
+        kwargs['participation'] = self.get_participation()
         return kwargs
     
     def get_context_data(self, *args, **kwargs):
         context = super(StandupFormView, self).get_context_data(**kwargs)
-        standup = models.Standup.objects.filter(
-            participants__single_use_token=self.kwargs['token']
-        ).first()
-
-        if not standup:
-            raise Http404('Standup not found!')
-        
-        context['standup'] = standup
+        context['standup'] = self.get_participation().standup
         return context
 
 
-class PublicStandupView(TemplateView):
+class StandupContextMixin(object):
+    '''
+    Builds everything standup.html needs up front, so rendering a standup
+    takes the same number of queries no matter how many participants it has.
+    '''
+
+    def get_standup_context(self, standup):
+        participants = list(standup.participants.filter(read_only=False).select_related('user').prefetch_related(
+            Prefetch('answers', queryset=models.StandupParticipationAnswer.objects.select_related('question').order_by('question__order'))
+        ).order_by('user__first_name'))
+
+        return {
+            'standup': standup,
+            'participants': [p for p in participants if p.completed],
+            'inactive': [p for p in participants if not p.completed],
+        }
+
+
+class PublicStandupView(StandupContextMixin, TemplateView):
     template_name = 'standup.html'
 
+    def get(self, request, *args, **kwargs):
+        key = cache.public_page_key(kwargs['server'], kwargs['channel'], kwargs['standup_type'], kwargs['date'])
+        content = cache.page_cache().get(key)
+
+        if content is not None:
+            return HttpResponse(content)
+
+        response = super(PublicStandupView, self).get(request, *args, **kwargs)
+        response.render()
+
+        # Only past standups are cached, the newest one still gets a next link,
+        # and only under the canonical URL so invalidation can find it
+        context = response.context_data
+        if context['next'] and str(context['standup'].standup_date) == kwargs['date']:
+            cache.page_cache().set(key, response.content)
+
+        return response
+
     def get_context_data(self, **kwargs):
         context = super(PublicStandupView, self).get_context_data(**kwargs)
         standup = models.Standup.objects.filter(
@@ -115,28 +165,30 @@ class PublicStandupView(TemplateView):
             event__channel__slug=kwargs['channel'], 
             event__channel__server__slug=kwargs['server'],
             event__standup_type__command_name=kwargs['standup_type']
-        ).first()
+        ).select_related('event__channel__server', 'event__standup_type').first()
 
         if not standup:
             raise Http404('Standup not found!')
         
-        context['standup'] = standup
+        context.update(self.get_standup_context(standup))
+
+        context['previous'], context['next'] = standup.neighbours()
+
         return context
 
 
-class PrivateStandupView(TemplateView):
+class PrivateStandupView(ParticipationMixin, StandupContextMixin, TemplateView):
     template_name = 'standup.html'
 
     def get_context_data(self, **kwargs):
         context = super(PrivateStandupView, self).get_context_data(**kwargs)
-        standup = models.Standup.objects.filter(
-            participants__single_use_token=kwargs['token']
-        ).first()
+        participation = self.get_participation()
 
-        if not standup:
+        if not participation:
             raise Http404('Standup not found!')
         
-        context['standup'] = standup
+        context.update(self.get_standup_context(participation.standup))
         context['token'] = kwargs['token']
-        context['participation'] = models.StandupParticipation.objects.get(single_use_token=kwargs['token'])
+        context['participation'] = participation
+        context['previous'], context['next'] = participation.neighbours()
         return context